@@ -13,4 +13,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'buensabor_backend.settings')
 
-application = get_asgi_application()
\ No newline at end of file
+django_application = get_asgi_application()
+
+# El WebSocket de cocina se importa después de inicializar Django (usa modelos y DRF)
+from gestion.cocina_ws import RUTA as RUTA_WS_COCINA, cocina_ws  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """
+    HTTP (API, admin, SSE) lo atiende Django; los WebSocket de /ws/cocina/
+    van a gestion.cocina_ws. Requiere un servidor ASGI (uvicorn, daphne):
+    con runserver/WSGI la API funciona igual, solo sin WebSocket.
+    """
+    if scope['type'] == 'websocket':
+        if scope['path'] == RUTA_WS_COCINA:
+            return await cocina_ws(scope, receive, send)
+        # Ruta desconocida: se rechaza el handshake
+        await receive()
+        await send({'type': 'websocket.close', 'code': 4004})
+        return
+    return await django_application(scope, receive, send)
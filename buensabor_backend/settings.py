@@ -1,6 +1,7 @@
 
 from pathlib import Path
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -57,13 +58,23 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware', # NUEVA LINEA
+    # gzip para las respuestas JSON grandes (no afecta al SSE). Quitar para desactivarlo.
+    'gestion.middleware.GZipAPIMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Usuario de las conexiones SSE a partir de ?_sse_token= (permisos por canal)
+    'gestion.middleware.TokenSSEMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Limpia la base de datos de sucursal elegida en cada request (gestion/routers.py)
+    'gestion.middleware.SucursalMiddleware',
+    # Tras una escritura, las lecturas del usuario no van a la réplica por unos segundos
+    'gestion.middleware.EscrituraRecienteMiddleware',
+    # Cuenta las requests en curso para rechazar las de baja prioridad con sobrecarga
+    'gestion.middleware.EnCursoMiddleware',
 ]
 
 ROOT_URLCONF = 'buensabor_backend.urls'
@@ -102,6 +113,18 @@ DATABASES = {
     }
 }
 
+# Cada sucursal puede tener su propia base: agregar el alias aquí y ponerlo en
+# Sucursal.base_datos. El router manda allí las consultas de esa sucursal.
+# Réplicas de solo lectura: {alias principal: alias réplica} (también para las bases de sucursal).
+# Listados del admin, reportes/exportaciones (gestion.replicas.en_replica) y los GET
+# de salón y menú leen de la réplica; el resto, y quien acaba de escribir, de la principal.
+# "Quien acaba de escribir" se recuerda en CACHES['replicas']: con varios procesos debe ser compartido.
+# Para probarlo en local basta un segundo alias a la misma base:
+#   DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+#   REPLICAS_LECTURA = {'default': 'replica'}
+REPLICAS_LECTURA = {}
+DATABASE_ROUTERS = ['gestion.routers.ReplicaRouter', 'gestion.routers.SucursalRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -145,14 +168,44 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 CORS_ALLOW_ALL_ORIGINS = True
+# Cabeceras propias de la API (sucursal, idempotencia, precondición de estado)
+CORS_ALLOW_HEADERS = (*default_headers, 'x-sucursal', 'idempotency-key', 'if-match')
+CORS_EXPOSE_HEADERS = ('etag', 'idempotent-replayed')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
+    # orjson si está instalado (si no, el JSONRenderer de DRF); la API navegable se mantiene
+    'DEFAULT_RENDERER_CLASSES': (
+        'gestion.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # Límites por rol y endpoint + rechazo por sobrecarga (gestion/throttling.py).
+    # La cocina y los pedidos nuevos tienen prioridad sobre el salón y los reportes.
+    'DEFAULT_THROTTLE_CLASSES': (
+        'gestion.throttling.SobrecargaThrottle',
+        'gestion.throttling.RolThrottle',
+    ),
+    # '<throttle_scope>' o '<throttle_scope>.<rol>' (admin, cocina, mesero, usuario, anonimo)
+    'DEFAULT_THROTTLE_RATES': {
+        'cocina': '600/min',
+        'pedido-nuevo': '120/min',
+        'pedidos': '240/min',
+        'tickets': '240/min',
+        'batch': '120/min',
+        'mesas': '120/min',
+        'salon': '20/min',
+        'salon.admin': '60/min',
+        'menu': '60/min',
+        'usuario': '30/min',
+    },
 }
 
+# Cada canal SSE de sucursal ('cocina-3', 'mesa-7-3', ...) solo lo leen usuarios con acceso a esa sucursal
+EVENTSTREAM_CHANNELMANAGER_CLASS = 'gestion.sucursales.CanalesSucursalManager'
+
 DJANGO_EVENTSTREAM = {
     'JWT_AUTH': True,  # Habilita la autenticación por JWT
     'JWT_SECRET': SECRET_KEY, # Usa la MISMA clave secreta que SIMPLE_JWT
@@ -169,7 +222,36 @@ CACHES = {
     'eventstream': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'eventstream-in-memory-cache',
-    }
+    },
+    # Respuestas guardadas por Idempotency-Key (gestion/idempotencia.py).
+    # TIMEOUT = cuánto se recuerda cada clave; MAX_ENTRIES = tope del almacén.
+    # Con varios procesos, usar un backend compartido (Redis/Memcached).
+    'idempotencia': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'idempotencia-in-memory-cache',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Quién escribió hace poco, para leer de la principal y no de la réplica (gestion/replicas.py).
+    # En memoria solo sirve con un proceso: con REPLICAS_LECTURA y varios workers,
+    # usar un backend compartido (Redis/Memcached) o la lectura siguiente puede ir a la réplica atrasada.
+    'replicas': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'replicas-in-memory-cache',
+    },
+    # Opcional: con varios procesos, un caché compartido para que los límites de uso
+    # (gestion/throttling.py) se cuenten entre todos. Sin él, cada proceso limita por su cuenta.
+    # 'throttle': {
+    #     'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    #     'LOCATION': 'redis://127.0.0.1:6379/1',
+    # },
+    # Necesario con varios procesos: avisa a cada proceso que su planificador de cocina
+    # (gestion/planificador.py, en memoria) quedó viejo porque otro proceso cambió algo.
+    # Sin él, usar un solo proceso o aceptar hasta RESYNC_SEGUNDOS de atraso entre procesos.
+    # 'planificador': {
+    #     'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    #     'LOCATION': 'redis://127.0.0.1:6379/2',
+    # },
 }
 
 # La variable EVENTSTREAM_REDIS es opcional si definiste una caché
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { fetchAPI, checkAuth, API_BASE_URL } from '../utils/api.js';
 
@@ -8,6 +8,10 @@ function Cocina() {
   const [error, setError] = useState('');
   const [isLoading, setIsLoading] = useState(true);
   const [updatingItemId, setUpdatingItemId] = useState(null);
+  // WebSocket de cocina (si el backend corre con ASGI) y comandos esperando respuesta
+  const wsRef = useRef(null);
+  const pendientesRef = useRef({});
+  const refSeqRef = useRef(0);
 
   // --- FUNCIÓN PARA CARGAR PEDIDOS ---
   const cargarPedidosCocina = useCallback(async (isInitialLoad = false) => {
@@ -22,7 +26,7 @@ function Cocina() {
           .map(pedido => {
              const mesaNumero = pedido.mesa?.numero ?? '??';
              const detallesFiltrados = Array.isArray(pedido.detalles) ? pedido.detalles.filter(detalle =>
-                 detalle.producto?.estacion === 'cocina' &&
+                 detalle.estacion === 'cocina' &&
                  (detalle.estado === 'recibido' || detalle.estado === 'preparacion')
              ) : [];
              return { ...pedido, mesaNumero, detalles: detallesFiltrados };
@@ -46,72 +50,122 @@ function Cocina() {
     }
   }, [error]);
 
-  // --- useEffect PARA ESCUCHAR EVENTOS SSE ---
+  // --- useEffect PARA ESCUCHAR EVENTOS (WebSocket, o SSE si no está disponible) ---
   useEffect(() => {
     // 1. Carga inicial
     cargarPedidosCocina(true);
 
-    // 2. Conexión SSE
     const token = localStorage.getItem('accessToken');
     if (!token) {
-        console.error("Cocina SSE: No hay token para EventSource.");
+        console.error("Cocina: No hay token para las notificaciones.");
         setError("Error de autenticación para notificaciones.");
         return;
     }
+    const sucursalId = localStorage.getItem('sucursalId');
+    let sse = null;
+    let desmontado = false;
 
-    const eventSourceUrl = `${API_BASE_URL}/api/events/?channel=cocina&_sse_token=${token}`;
-    console.log("Cocina SSE: Conectando a", eventSourceUrl);
-
-    const sse = new EventSource(eventSourceUrl);
-
-    // 3. Escuchadores de eventos (CON PARSEO DE JSON)
-    sse.addEventListener('nuevo_item', (event) => {
-        console.log('¡SSE RECIBIDO: nuevo_item!', event.data);
-        try {
-            const data = JSON.parse(event.data);
+    // Mismos eventos por WebSocket o por SSE
+    const manejarEvento = (tipo, data) => {
+        if (tipo === 'nuevo_item') {
             console.log(`Nuevo pedido: ${data.producto_nombre} x${data.cantidad} - Mesa ${data.mesa_numero}`);
             // Volvemos a cargar todo para que aparezca el nuevo pedido
             cargarPedidosCocina(false); // false = no mostrar loader
-        } catch (e) {
-            console.error('Error parseando evento nuevo_item:', e);
-        }
-    });
-
-    sse.addEventListener('item_entregado', (event) => {
-        console.log('¡SSE RECIBIDO: item_entregado!', event.data);
-        try {
-            const data = JSON.parse(event.data);
+        } else if (tipo === 'item_entregado') {
             console.log(`Item entregado: detalle ${data.detalle_id}`);
             // Volvemos a cargar todo para que el ítem desaparezca de la lista
             cargarPedidosCocina(false);
-        } catch (e) {
-            console.error('Error parseando evento item_entregado:', e);
         }
-    });
+    };
 
-    sse.onerror = (err) => {
-        console.error('Error de EventSource (SSE):', err);
-        setError('Error de conexión en tiempo real.');
-        sse.close();
+    // 2a. Conexión SSE (respaldo: backend sin ASGI o WebSocket caído)
+    const conectarSSE = () => {
+        // Canal de la cocina de esta sucursal
+        const eventSourceUrl = `${API_BASE_URL}/api/events/?channel=cocina-${sucursalId}&_sse_token=${token}`;
+        console.log("Cocina SSE: Conectando a", eventSourceUrl);
+        sse = new EventSource(eventSourceUrl);
+
+        ['nuevo_item', 'item_entregado'].forEach(tipo => {
+            sse.addEventListener(tipo, (event) => {
+                console.log(`¡SSE RECIBIDO: ${tipo}!`, event.data);
+                try {
+                    manejarEvento(tipo, JSON.parse(event.data));
+                } catch (e) {
+                    console.error(`Error parseando evento ${tipo}:`, e);
+                }
+            });
+        });
+
+        sse.onerror = (err) => {
+            console.error('Error de EventSource (SSE):', err);
+            setError('Error de conexión en tiempo real.');
+            sse.close();
+        };
     };
 
-    // 4. Limpieza al desmontar el componente
+    // 2b. WebSocket: autentica una vez y lleva eventos y cambios de estado
+    const ws = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/ws/cocina/`);
+    ws.onopen = () => ws.send(JSON.stringify({ token, sucursal: sucursalId }));
+    ws.onmessage = (msg) => {
+        const data = JSON.parse(msg.data);
+        if (data.tipo === 'conectado') {
+            console.log("Cocina WS: Conectado al canal", data.canal);
+            wsRef.current = ws;
+        } else if (data.tipo === 'evento') {
+            manejarEvento(data.evento, data.datos);
+        } else if (data.tipo === 'desborde') {
+            cargarPedidosCocina(false); // Se perdieron eventos: recargamos todo
+        } else if (data.tipo === 'respuesta') {
+            const resolver = pendientesRef.current[data.ref];
+            delete pendientesRef.current[data.ref];
+            if (resolver) resolver(data);
+        } else if (data.tipo === 'error') {
+            console.warn("Cocina WS:", data.error);
+        }
+    };
+    ws.onclose = () => {
+        wsRef.current = null;
+        // Los comandos sin respuesta fallan; el usuario puede reintentar (por HTTP)
+        Object.values(pendientesRef.current).forEach(resolver => resolver({ status: 0, body: { error: 'Conexión cerrada.' } }));
+        pendientesRef.current = {};
+        if (!desmontado) conectarSSE();
+    };
+
+    // 3. Limpieza al desmontar el componente
     return () => {
-        console.log("Cocina SSE: Desmontando componente, cerrando conexión EventSource.");
-        sse.close();
+        console.log("Cocina: Desmontando componente, cerrando conexiones.");
+        desmontado = true;
+        ws.close();
+        if (sse) sse.close();
     };
   }, [cargarPedidosCocina]);
 
+  // Envía un cambio de estado por el WebSocket y espera su respuesta
+  const enviarPorWebSocket = (comando) => new Promise((resolve) => {
+    const ref = ++refSeqRef.current;
+    pendientesRef.current[ref] = resolve;
+    wsRef.current.send(JSON.stringify({ ref, ...comando }));
+  });
+
   // --- Función para Actualizar el Estado ---
-  const handleActualizarEstado = async (detalleId, nuevoEstado) => {
+  const handleActualizarEstado = async (detalleId, estadoActual, nuevoEstado) => {
     if (updatingItemId) return;
     setError('');
     setUpdatingItemId(detalleId);
     try {
-      await fetchAPI(`/api/detalles-pedido/${detalleId}/`, {
-        method: 'PATCH',
-        body: JSON.stringify({ estado: nuevoEstado })
-      });
+      if (wsRef.current) {
+        // Misma validación que el PATCH (409 si otro usuario ya cambió el ítem), sin un request por clic
+        const respuesta = await enviarPorWebSocket({ detalle: detalleId, estado: nuevoEstado, desde: estadoActual });
+        if (respuesta.status < 200 || respuesta.status >= 300) {
+          throw new Error(respuesta.body?.detail || respuesta.body?.error || `Error ${respuesta.status}`);
+        }
+      } else {
+        await fetchAPI(`/api/detalles-pedido/${detalleId}/`, {
+          method: 'PATCH',
+          // expected_estado: el backend responde 409 si otro usuario ya cambió el ítem
+          body: JSON.stringify({ estado: nuevoEstado, expected_estado: estadoActual })
+        });
+      }
       // El backend enviará eventos SSE automáticamente, pero recargamos por si acaso
       cargarPedidosCocina(false);
     } catch (err) {
@@ -156,15 +210,15 @@ function Cocina() {
               </h3>
               {Array.isArray(pedido.detalles) && pedido.detalles.map(detalle => (
                 <div key={detalle.id} className={`item-cocina item-estado-${detalle.estado}`}>
-                  <span>{detalle.cantidad}x {detalle.producto?.nombre || 'Producto Desconocido'}</span>
+                  <span>{detalle.cantidad}x {detalle.producto_nombre || 'Producto Desconocido'}</span>
                   <div>
                     {detalle.estado === 'recibido' && (
-                      <button className="estado-btn preparacion" onClick={() => handleActualizarEstado(detalle.id, 'preparacion')} disabled={!!updatingItemId}>
+                      <button className="estado-btn preparacion" onClick={() => handleActualizarEstado(detalle.id, detalle.estado, 'preparacion')} disabled={!!updatingItemId}>
                         Preparar
                       </button>
                     )}
                     {detalle.estado === 'preparacion' && (
-                      <button className="estado-btn listo" onClick={() => handleActualizarEstado(detalle.id, 'listo')} disabled={!!updatingItemId}>
+                      <button className="estado-btn listo" onClick={() => handleActualizarEstado(detalle.id, detalle.estado, 'listo')} disabled={!!updatingItemId}>
                         Listo
                       </button>
                     )}
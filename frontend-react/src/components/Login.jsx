@@ -60,9 +60,15 @@ function Login({ onLoginSuccess }) {
 
       // 3. Obtener Datos del Usuario
       console.log("Login: Obteniendo datos del usuario desde /api/users/me/...");
+      localStorage.removeItem('sucursalId');
       const userData = await fetchAPI('/api/users/me/');
       console.log("Login: Datos del usuario recibidos:", userData);
 
+      // Sucursal de trabajo: se envía en cada llamada (X-Sucursal) y define los canales SSE
+      if (Array.isArray(userData.sucursales) && userData.sucursales.length > 0) {
+        localStorage.setItem('sucursalId', userData.sucursales[0].id);
+      }
+
       // 4. DECIDIR RUTA BASADO EN ROL
       const userGroups = userData.groups || [];
       let targetPath = '/';
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { fetchAPI, checkAuth, API_BASE_URL } from '../utils/api.js';
 
@@ -19,6 +19,8 @@ function Mesa() {
   const [showPagoModal, setShowPagoModal] = useState(false);
   const [totalAPagar, setTotalAPagar] = useState(0);
   const [puedeCobrar, setPuedeCobrar] = useState(false);
+  // Idempotency-Key del pedido en envío: se reutiliza si hay que reintentar el mismo carrito
+  const pedidoKeyRef = useRef(null);
 
   // --- FUNCIÓN PRINCIPAL PARA CARGAR DATOS ---
   const cargarVistaMesa = useCallback(async () => {
@@ -62,9 +64,9 @@ function Mesa() {
                 } else {
                   itemsMap.set(productoId, {
                     productoId: detalle.producto.id,
-                    nombre: detalle.producto.nombre,
+                    nombre: detalle.producto_nombre || detalle.producto.nombre,
                     cantidadTotal: detalle.cantidad,
-                    estacion: detalle.producto.estacion,
+                    estacion: detalle.estacion || detalle.producto.estacion,
                     detallesOriginales: [{ id: detalle.id, cantidad: detalle.cantidad, estado: detalle.estado }]
                   });
                 }
@@ -98,8 +100,10 @@ function Mesa() {
         return;
     }
 
-    const channel = `mesa-${mesaId}`;
-    const eventSourceUrl = `${API_BASE_URL}/api/events/?channel=${channel}&_sse_token=${token}`
+    // Canal de la mesa + canal 'menu' de la sucursal (cambios de disponibilidad/stock)
+    const sucursalId = localStorage.getItem('sucursalId');
+    const channel = `mesa-${mesaId}-${sucursalId}`;
+    const eventSourceUrl = `${API_BASE_URL}/api/events/?channel=${channel}&channel=menu-${sucursalId}&_sse_token=${token}`
     console.log(`Mesa ${mesaId} SSE: Conectando a`, eventSourceUrl);
 
     const sse = new EventSource(eventSourceUrl);
@@ -117,6 +121,20 @@ function Mesa() {
         }
     });
 
+    // Escuchar 'disponibilidad': actualiza stock/disponible en el menú sin volver a pedir /api/categorias/
+    sse.addEventListener('disponibilidad', (event) => {
+        try {
+            const { productos } = JSON.parse(event.data);
+            const cambios = new Map(productos.map(p => [p.id, p]));
+            setMenu(prev => prev.map(categoria => ({
+                ...categoria,
+                productos: categoria.productos.map(p => cambios.has(p.id) ? { ...p, ...cambios.get(p.id) } : p)
+            })));
+        } catch (e) {
+            console.error('Error parseando evento disponibilidad:', e);
+        }
+    });
+
     sse.onerror = (err) => {
         console.error(`Error de EventSource (SSE) en Mesa ${mesaId}:`, err);
         setError('Error de conexión en tiempo real.');
@@ -131,6 +149,7 @@ function Mesa() {
 
   // --- Funciones Carrito ---
   const handleAddToCart = (producto) => {
+    pedidoKeyRef.current = null; // carrito distinto = pedido distinto
     setCarrito(prev => {
       const existente = prev.find(item => item.productoId === producto.id);
       if (existente) {
@@ -141,6 +160,7 @@ function Mesa() {
   };
 
   const handleRemoveFromCart = (productoId) => {
+    pedidoKeyRef.current = null;
     setCarrito(prev => {
       const existente = prev.find(item => item.productoId === productoId);
       if (!existente) return prev;
@@ -156,9 +176,9 @@ function Mesa() {
       setError('');
       setIsActionLoading(true);
       console.log(`Mesa ${mesaId}: Entregando item(s)`, itemAgrupado);
-      const detallesAEntregarIds = itemAgrupado.detallesOriginales
-          .filter(d => (itemAgrupado.estacion === 'bar' && d.estado === 'recibido') || d.estado === 'listo')
-          .map(d => d.id);
+      const detallesAEntregar = itemAgrupado.detallesOriginales
+          .filter(d => (itemAgrupado.estacion === 'bar' && d.estado === 'recibido') || d.estado === 'listo');
+      const detallesAEntregarIds = detallesAEntregar.map(d => d.id);
 
       if (detallesAEntregarIds.length === 0) {
           console.warn(`Mesa ${mesaId}: No hay detalles listos para entregar para ${itemAgrupado.nombre}`);
@@ -166,11 +186,14 @@ function Mesa() {
           return;
       }
       console.log(`Mesa ${mesaId}: IDs a marcar como entregados:`, detallesAEntregarIds);
-      const updatePromises = detallesAEntregarIds.map(detalleId =>
-          fetchAPI(`/api/detalles-pedido/${detalleId}/`, { method: 'PATCH', body: JSON.stringify({ estado: 'entregado' }) })
-      );
+      // Un solo /api/batch/ (una transacción). expected_estado: si la cocina cambió un ítem mientras tanto, 409
+      const operaciones = detallesAEntregar.map(d => ({
+          method: 'PATCH',
+          url: `/api/detalles-pedido/${d.id}/`,
+          body: { estado: 'entregado', expected_estado: d.estado }
+      }));
       try {
-          await Promise.all(updatePromises);
+          await fetchAPI('/api/batch/', { method: 'POST', body: JSON.stringify({ operaciones }) });
           console.log(`Mesa ${mesaId}: Item(s) ${itemAgrupado.nombre} entregado(s).`);
           cargarVistaMesa();
       } catch (err) {
@@ -192,12 +215,26 @@ function Mesa() {
     setIsActionLoading(true);
     console.log(`Mesa ${mesaId}: Enviando nuevo pedido...`, pedidoData);
     try {
-      await fetchAPI('/api/pedidos/', { method: 'POST', body: JSON.stringify(pedidoData) });
+      if (!pedidoKeyRef.current) pedidoKeyRef.current = crypto.randomUUID();
+      await fetchAPI('/api/pedidos/', {
+        method: 'POST',
+        headers: { 'Idempotency-Key': pedidoKeyRef.current },
+        body: JSON.stringify(pedidoData)
+      });
       alert('¡Nuevos ítems enviados!');
       console.log(`Mesa ${mesaId}: Nuevo pedido enviado.`);
+      pedidoKeyRef.current = null;
       setCarrito([]);
       cargarVistaMesa();
     } catch (err) {
+      if (err.codigo === 'idempotencia_fallida') {
+        // El envío anterior falló en el servidor y pudo haberse guardado: se recarga la mesa
+        // para verlo, y el próximo envío usa una clave nueva
+        pedidoKeyRef.current = null;
+        cargarVistaMesa();
+        alert('No se pudo confirmar el envío anterior. Revisa los pedidos de la mesa antes de volver a enviar.');
+        return;
+      }
       setError(err.message);
       alert(`Error al enviar pedido: ${err.message}`);
       console.error(`Mesa ${mesaId}: Error al enviar:`, err);
@@ -233,18 +270,16 @@ function Mesa() {
     setIsActionLoading(true);
     console.log(`Mesa ${mesaId}: Intentando finalizar mesa...`);
     try {
-        if (mesaData && mesaData.pedidos) {
-            const updatePromises = mesaData.pedidos
-                .filter(pedido => pedido.estado !== 'pagado')
-                .map(pedido => {
-                    console.log(`Mesa ${mesaId}: Marcando pedido ${pedido.id} como pagado.`);
-                    return fetchAPI(`/api/pedidos/${pedido.id}/`, { method: 'PATCH', body: JSON.stringify({ estado: 'pagado' }) });
-                });
-            await Promise.all(updatePromises);
-            console.log(`Mesa ${mesaId}: Pedidos marcados como pagados.`);
-        }
-        console.log(`Mesa ${mesaId}: Liberando mesa...`);
-        await fetchAPI(`/api/mesas/${mesaId}/`, { method: 'PATCH', body: JSON.stringify({ estado: 'disponible' }) });
+        // Pedidos pagados + mesa liberada en un solo /api/batch/: o se aplica todo o nada
+        const operaciones = (mesaData?.pedidos || [])
+            .filter(pedido => pedido.estado !== 'pagado')
+            .map(pedido => {
+                console.log(`Mesa ${mesaId}: Marcando pedido ${pedido.id} como pagado.`);
+                return { method: 'PATCH', url: `/api/pedidos/${pedido.id}/`, body: { estado: 'pagado' } };
+            });
+        operaciones.push({ method: 'PATCH', url: `/api/mesas/${mesaId}/`, body: { estado: 'disponible' } });
+        console.log(`Mesa ${mesaId}: Pagando pedidos y liberando mesa...`);
+        await fetchAPI('/api/batch/', { method: 'POST', body: JSON.stringify({ operaciones }) });
         alert('Mesa finalizada.');
         console.log(`Mesa ${mesaId}: Mesa liberada. Navegando a /salon.`);
         navigate('/salon');
@@ -292,7 +327,7 @@ function Mesa() {
                 {Array.isArray(categoria.productos) && categoria.productos.map(producto => (
                   <div key={producto.id} className="producto-item">
                     <span>{producto.nombre} - ${producto.precio}</span>
-                    <button className="add-to-cart-btn" onClick={() => handleAddToCart(producto)} disabled={isActionLoading}>+</button>
+                    <button className="add-to-cart-btn" onClick={() => handleAddToCart(producto)} disabled={isActionLoading || !producto.disponible}>+</button>
                   </div>
                 ))}
               </div>
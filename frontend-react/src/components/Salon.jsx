@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 // Asegúrate que la ruta a api.js sea correcta
-import { fetchAPI, checkAuth } from '../utils/api.js';
+import { fetchAPI, checkAuth, API_BASE_URL } from '../utils/api.js';
 
 function Salon() {
   // 1. Proteger la página: si no hay token, redirige a /login
@@ -26,8 +26,8 @@ function Salon() {
       console.log("Salon: Iniciando carga de mesas...");
 
       try {
-        // Llama a la API para obtener las mesas
-        const data = await fetchAPI('/api/mesas/');
+        // Estado compacto de las mesas (sin el historial de pedidos)
+        const data = await fetchAPI('/api/mesas/salon/');
         console.log("Salon: Datos RECIBIDOS de fetchAPI:", data);
 
         // Verifica si la respuesta es un array (lista)
@@ -51,6 +51,24 @@ function Salon() {
       }
     };
     cargarMesas(); 
+
+    // Cambios en vivo: el backend junta las ráfagas y manda solo las mesas que cambiaron
+    const token = localStorage.getItem('accessToken');
+    const sucursalId = localStorage.getItem('sucursalId');
+    if (!token) return;
+    const sse = new EventSource(`${API_BASE_URL}/api/events/?channel=salon-${sucursalId}&_sse_token=${token}`);
+    sse.addEventListener('mesas', (event) => {
+      try {
+        const { mesas: cambios } = JSON.parse(event.data);
+        const porId = Object.fromEntries(cambios.map(mesa => [mesa.id, mesa]));
+        setMesas(prev => Array.isArray(prev) ? prev.map(mesa => porId[mesa.id] ?? mesa) : prev);
+      } catch (e) {
+        console.error('Salon: Error parseando evento mesas:', e);
+      }
+    });
+    sse.onerror = (err) => console.error('Salon: Error de EventSource (SSE):', err);
+
+    return () => sse.close();
   }, []); 
 
   // 3. Función para manejar el logout
@@ -130,6 +148,8 @@ function Salon() {
             >
               <h3>Mesa #{mesa.numero}</h3>
               <p>{mesa.estado}</p> {/* Muestra el estado actual */}
+              {mesa.listos > 0 && <p className="mesa-listos">{mesa.listos} para servir</p>}
+              {mesa.pendientes > 0 && <p className="mesa-pendientes">{mesa.pendientes} pendientes</p>}
               {/* No mostramos botón cobrar aquí */}
             </div>
           ))}
@@ -5,6 +5,7 @@ const redirectToLogin = () => {
     console.warn("Redirigiendo a login...");
     localStorage.removeItem('accessToken');
     localStorage.removeItem('refreshToken');
+    localStorage.removeItem('sucursalId');
     window.location.replace('/login');
 };
 
@@ -12,6 +13,12 @@ export const fetchAPI = async (endpoint, options = {}) => {
     const token = localStorage.getItem('accessToken');
     const headers = { 'Content-Type': 'application/json', ...options.headers };
 
+    // Sucursal elegida al iniciar sesión (el backend filtra todo por ella)
+    const sucursalId = localStorage.getItem('sucursalId');
+    if (sucursalId && !endpoint.includes('/api/token/')) {
+        headers['X-Sucursal'] = sucursalId;
+    }
+
     if (token && !endpoint.includes('/api/token/')) {
         headers['Authorization'] = `Bearer ${token}`;
     } else if (!token && !endpoint.includes('/api/token/')) {
@@ -32,12 +39,17 @@ export const fetchAPI = async (endpoint, options = {}) => {
                  throw new Error('Sesión inválida o permisos insuficientes.');
             }
             let errorDetail = `Error: ${response.status} ${response.statusText}`;
+            let errorData = null;
             try {
-                const errorData = await response.json();
+                errorData = await response.json();
                 errorDetail = errorData.detail || errorData.error || JSON.stringify(errorData) || errorDetail;
             } catch (e) { /* No hacer nada si no hay JSON */ }
             console.error(`fetchAPI: Error final para ${endpoint}:`, errorDetail);
-            throw new Error(errorDetail);
+            // status/codigo para que cada pantalla distinga errores (ej: 'idempotencia_fallida')
+            const error = new Error(errorDetail);
+            error.status = response.status;
+            error.codigo = errorData?.codigo;
+            throw error;
         }
 
         if (response.status === 204) return null;
@@ -1,17 +1,109 @@
-from django.contrib import admin
-from .models import Mesa, Categoria, Producto, Pedido, PedidoDetalle, Turno
-from django.utils import timezone 
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import Sucursal, Mesa, Categoria, Producto, Pedido, PedidoDetalle, Turno
+from .middleware import SESION_SUCURSAL_ADMIN
+from .replicas import en_replica, escribio_hace_poco
+from .sucursales import sucursales_de
+from django.utils import timezone
 
-admin.site.register(Mesa)
-admin.site.register(Producto)
+# A partir de cuántas filas se usa el conteo estimado del motor en vez de COUNT(*)
+UMBRAL_CONTEO_ESTIMADO = 100000
+
+
+def filas_estimadas(model, using):
+    """ Filas aproximadas de la tabla según las estadísticas del motor (None si no se puede). """
+    connection = connections[using]
+    tabla = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [tabla]
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [tabla])
+        else:
+            return None
+        fila = cursor.fetchone()
+    return int(fila[0]) if fila and fila[0] is not None else None
+
+
+class ConteoEstimadoPaginator(Paginator):
+    """
+    Paginador del admin para tablas grandes: sin filtros, usa el conteo estimado
+    del motor (instantáneo) en vez de COUNT(*) (recorre toda la tabla en InnoDB).
+    Con filtros, o si la tabla es chica, cuenta de verdad.
+    """
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimado = filas_estimadas(queryset.model, queryset.db)
+            if estimado is not None and estimado > UMBRAL_CONTEO_ESTIMADO:
+                return estimado
+        return super().count
+
+
+class HistorialAdmin(admin.ModelAdmin):
+    """ Base para los modelos que crecen con el historial (pedidos, detalles, turnos). """
+    paginator = ConteoEstimadoPaginator
+    show_full_result_count = False # Evita un segundo COUNT(*) sobre toda la tabla al filtrar
+    list_per_page = 50
+
+    def changelist_view(self, request, extra_context=None):
+        # Listado desde la réplica; las acciones masivas (POST) y lo recién modificado, de la principal
+        with en_replica(request.method == 'GET' and not escribio_hace_poco(request.user)):
+            response = super().changelist_view(request, extra_context)
+            if hasattr(response, 'render'):
+                response.render() # La lista se consulta al renderizar: hay que hacerlo dentro del bloque
+        return response
+
+
+@admin.register(Sucursal)
+class SucursalAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'base_datos')
+    filter_horizontal = ('empleados',)
+
+    # Una sucursal con base propia se administra eligiéndola aquí: desde entonces
+    # el resto del admin lee y escribe en su base (ver SucursalMiddleware)
+    def administrar_sucursal(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Selecciona una sola sucursal.", messages.WARNING)
+            return
+        sucursal = queryset.first()
+        if not sucursales_de(request.user).filter(pk=sucursal.pk).exists():
+            self.message_user(request, f"No tienes acceso a {sucursal}.", messages.ERROR)
+            return
+        request.session[SESION_SUCURSAL_ADMIN] = sucursal.pk
+        self.message_user(request, f"El admin ahora trabaja sobre {sucursal} (base '{sucursal.base_datos or 'default'}').")
+    administrar_sucursal.short_description = "Administrar esta sucursal"
+    actions = [administrar_sucursal]
+
+@admin.register(Mesa)
+class MesaAdmin(admin.ModelAdmin):
+    list_display = ('numero', 'sucursal', 'estado')
+    list_filter = ('sucursal', 'estado')
+    list_select_related = ('sucursal',)
+
+@admin.register(Producto)
+class ProductoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'categoria', 'precio', 'disponible', 'stock')
+    list_filter = ('categoria__sucursal', 'categoria', 'disponible')
+    list_select_related = ('categoria',)
+    search_fields = ('nombre',) # Necesario para el autocomplete de los detalles
 
 @admin.register(Turno)
-class TurnoAdmin(admin.ModelAdmin):
-    list_display = ('id', 'fecha_inicio', 'fecha_fin', 'abierto_por', 'estado')
-    list_filter = ('estado', 'abierto_por')
+class TurnoAdmin(HistorialAdmin):
+    list_display = ('id', 'sucursal', 'fecha_inicio', 'fecha_fin', 'abierto_por', 'estado')
+    list_filter = ('sucursal', 'estado')
+    list_select_related = ('abierto_por', 'sucursal') # Turno.__str__ usa abierto_por.username
+    date_hierarchy = 'fecha_inicio'
+    raw_id_fields = ('abierto_por',)
     readonly_fields = ('fecha_inicio',) # Hacemos fecha_inicio de solo lectura
 
-    # Acción para cerrar turnos
+    # Acción para cerrar turnos (un solo UPDATE para todos los seleccionados)
     def cerrar_turnos(self, request, queryset):
         queryset.update(estado='cerrado', fecha_fin=timezone.now())
     cerrar_turnos.short_description = "Cerrar turnos seleccionados"
@@ -21,17 +113,47 @@ class TurnoAdmin(admin.ModelAdmin):
 # Usamos el decorador para personalizar la vista de Categoria
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
-    list_display = ('nombre', 'estacion') 
-    list_filter = ('estacion',)          
+    list_display = ('nombre', 'sucursal', 'estacion')
+    list_filter = ('sucursal', 'estacion')
 
 # Usamos el decorador para personalizar la vista de Pedido
 @admin.register(Pedido)
-class PedidoAdmin(admin.ModelAdmin):
+class PedidoAdmin(HistorialAdmin):
     # Clase interna para mostrar los detalles del pedido de forma más limpia
     class PedidoDetalleInline(admin.TabularInline):
         model = PedidoDetalle
-        extra = 0 
+        extra = 0
+        # Autocomplete en vez de un <select> con todos los productos por fila
+        autocomplete_fields = ('producto',)
+        readonly_fields = ('producto_nombre', 'estacion')
+
+    list_display = ('id', 'sucursal', 'mesa', 'fecha_hora', 'estado')
+    list_filter = ('sucursal', 'estado')
+    list_select_related = ('mesa', 'sucursal')
+    date_hierarchy = 'fecha_hora'
+    raw_id_fields = ('mesa',)
+    inlines = [PedidoDetalleInline]
+
+    # Acción masiva: un solo UPDATE para todos los seleccionados
+    def marcar_pagados(self, request, queryset):
+        actualizados = queryset.exclude(estado='pagado').update(estado='pagado')
+        self.message_user(request, f"{actualizados} pedido(s) marcados como pagados.")
+    marcar_pagados.short_description = "Marcar pedidos seleccionados como pagados"
+    actions = [marcar_pagados]
+
+@admin.register(PedidoDetalle)
+class PedidoDetalleAdmin(HistorialAdmin):
+    # producto_nombre/estacion son la copia del pedido: la lista no necesita joins con Producto
+    list_display = ('id', 'pedido', 'producto_nombre', 'cantidad', 'estacion', 'estado')
+    list_filter = ('pedido__sucursal', 'estado', 'estacion')
+    list_select_related = ('pedido__mesa',) # Pedido.__str__ muestra la mesa
+    date_hierarchy = 'pedido__fecha_hora'
+    raw_id_fields = ('pedido',)
+    autocomplete_fields = ('producto',)
+    readonly_fields = ('producto_nombre', 'estacion')
 
-    list_display = ('id', 'mesa', 'fecha_hora', 'estado')
-    list_filter = ('estado', 'mesa')
-    inlines = [PedidoDetalleInline] 
\ No newline at end of file
+    def marcar_entregados(self, request, queryset):
+        actualizados = queryset.exclude(estado='entregado').update(estado='entregado')
+        self.message_user(request, f"{actualizados} ítem(s) marcados como entregados.")
+    marcar_entregados.short_description = "Marcar ítems seleccionados como entregados"
+    actions = [marcar_entregados]
@@ -0,0 +1,116 @@
+import io
+import json
+from urllib.parse import urlsplit
+
+from django.db import router, transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, Resolver404
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.viewsets import ViewSetMixin
+
+from .idempotencia import idempotente
+from .models import Pedido
+from .sucursales import sucursal_actual
+
+MAX_OPERACIONES = 20
+METODOS_PERMITIDOS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Cabeceras del request externo que NO se heredan: se deciden por operación
+CABECERAS_POR_OPERACION = ('HTTP_IF_MATCH', 'HTTP_IDEMPOTENCY_KEY', 'CONTENT_LENGTH', 'CONTENT_TYPE', 'QUERY_STRING')
+
+
+class BatchView(APIView):
+    """
+    POST /api/batch/ : ejecuta varias operaciones sobre los ViewSets de la API
+    en orden y dentro de una sola transacción.
+
+    Cuerpo: {"operaciones": [{"method": "PATCH", "url": "/api/detalles-pedido/3/",
+                              "body": {...}, "if_match": "listo"}, ...]}
+
+    El usuario se autentica una sola vez (el token del batch); cada operación
+    se ejecuta como ese usuario sin volver a validar el JWT, y los grupos del
+    usuario se consultan una vez para todos los chequeos de permisos.
+    Si una operación falla, se revierte todo y se responde con su status.
+    Acepta Idempotency-Key para el batch completo.
+    """
+    permission_classes = [IsAuthenticated]
+    # Cada operación pasa además por los límites (y la prioridad ante sobrecarga) de su propia vista
+    throttle_scope = 'batch'
+
+    @idempotente
+    def post(self, request):
+        operaciones = request.data.get('operaciones') if isinstance(request.data, dict) else None
+        if not isinstance(operaciones, list) or not operaciones:
+            return Response({'error': "Se requiere una lista 'operaciones' no vacía."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(operaciones) > MAX_OPERACIONES:
+            return Response({'error': f'Máximo {MAX_OPERACIONES} operaciones por batch.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # La sucursal fija la base de datos (gestion/routers.py) donde corre la transacción
+        sucursal = sucursal_actual(request)
+        resultados = []
+        with transaction.atomic(using=router.db_for_write(Pedido)):
+            for indice, operacion in enumerate(operaciones):
+                response = ejecutar_operacion(
+                    operacion, request.user, request.auth, request._request.META, sucursal
+                )
+                resultados.append({'status': response.status_code, 'body': response.data})
+                if not status.is_success(response.status_code):
+                    # Revierte las operaciones anteriores (y sus eventos SSE, que van en on_commit)
+                    transaction.set_rollback(True)
+                    return Response(
+                        {'error': f'Falló la operación {indice}; no se aplicó ningún cambio.',
+                         'indice': indice, 'resultados': resultados},
+                        status=response.status_code
+                    )
+        return Response({'resultados': resultados})
+
+
+def ejecutar_operacion(operacion, user, auth, meta, sucursal):
+    """
+    Ejecuta una operación ({method, url, body, if_match}) sobre un ViewSet de la API
+    como `user`, ya autenticado, en la sucursal dada. Devuelve la Response de la vista.
+    La usan /api/batch/ y el WebSocket de cocina (gestion/cocina_ws.py).
+    """
+    if not isinstance(operacion, dict):
+        return Response({'error': 'Cada operación debe ser un objeto.'}, status=status.HTTP_400_BAD_REQUEST)
+    metodo = str(operacion.get('method', 'GET')).upper()
+    if metodo not in METODOS_PERMITIDOS:
+        return Response({'error': f'Método no permitido: {metodo}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    url = urlsplit(str(operacion.get('url', '')))
+    try:
+        match = resolve(url.path)
+    except Resolver404:
+        return Response({'error': f'URL no encontrada: {url.path}'}, status=status.HTTP_404_NOT_FOUND)
+    # Solo los ViewSets registrados en el router de gestion/urls.py (no el batch, ni login, ni SSE)
+    vista = getattr(match.func, 'cls', None)
+    if vista is None or not issubclass(vista, ViewSetMixin):
+        return Response({'error': f'URL no disponible en batch: {url.path}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    cuerpo = json.dumps(operacion.get('body') or {}).encode('utf-8') if metodo != 'GET' else b''
+
+    sub = HttpRequest()
+    sub.method = metodo
+    sub.path = sub.path_info = url.path
+    sub.META = {k: v for k, v in meta.items() if k not in CABECERAS_POR_OPERACION}
+    sub.META.update({
+        'REQUEST_METHOD': metodo,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(cuerpo)),
+    })
+    if operacion.get('if_match'):
+        sub.META['HTTP_IF_MATCH'] = f'"{operacion["if_match"]}"'
+    sub.GET = QueryDict(url.query)
+    sub._stream = io.BytesIO(cuerpo)
+    sub._read_started = False
+    sub.resolver_match = match
+    # Autenticación ya hecha: DRF usa este usuario en vez de volver a validar el token
+    sub._force_auth_user = user
+    sub._force_auth_token = auth
+    # Sucursal ya resuelta: las vistas no vuelven a consultarla (ver sucursales.sucursal_actual)
+    sub._sucursal = sucursal
+
+    return match.func(sub, *match.args, **match.kwargs)
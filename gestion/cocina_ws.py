@@ -0,0 +1,204 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django_eventstream.views import Listener, get_listener_manager
+from rest_framework.exceptions import APIException, PermissionDenied
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .batch import ejecutar_operacion
+from .permissions import grupos_de
+from .sucursales import base_datos_actual, canal, resolver_sucursal
+
+RUTA = '/ws/cocina/'
+ESPERA_AUTENTICACION = 10 # Segundos que tiene el cliente para mandar el token
+
+# Códigos de cierre del WebSocket (4000-4999 quedan para la aplicación)
+CIERRE_INVALIDO = 4000
+CIERRE_NO_AUTENTICADO = 4001
+CIERRE_SIN_PERMISO = 4003
+
+
+class SesionCocina:
+    """ Lo que se resuelve una sola vez al conectar: usuario, token, sucursal y vencimiento. """
+    def __init__(self, user, token, sucursal, meta):
+        self.user = user
+        self.token = token
+        self.sucursal = sucursal
+        self.vence = token['exp'] # El socket se cierra cuando vence el access token
+        self.meta = meta
+
+
+def _meta(scope):
+    """ META base para las operaciones (como lo armaría Django para un request HTTP). """
+    cliente = scope.get('client') or ('', 0)
+    servidor = scope.get('server') or ('localhost', 80)
+    meta = {
+        'REMOTE_ADDR': cliente[0],
+        'SERVER_NAME': servidor[0],
+        'SERVER_PORT': str(servidor[1]),
+    }
+    for nombre, valor in scope.get('headers', []):
+        clave = 'HTTP_' + nombre.decode('latin1').upper().replace('-', '_')
+        meta[clave] = valor.decode('latin1')
+    return meta
+
+
+def autenticar(datos, scope):
+    """ Valida el JWT (una sola vez por conexión), el rol y la sucursal. """
+    close_old_connections()
+    try:
+        jwt = JWTAuthentication()
+        token = jwt.get_validated_token(datos.get('token') or '')
+        user = jwt.get_user(token)
+        # Mismo criterio que IsCocinaUser
+        if not (user.is_superuser or 'Cocina' in grupos_de(user)):
+            raise PermissionDenied('Solo personal de cocina puede usar este canal.')
+        sucursal = resolver_sucursal(user, datos.get('sucursal'))
+        return SesionCocina(user, token, sucursal, _meta(scope))
+    finally:
+        close_old_connections()
+
+
+def ejecutar_comando(sesion, comando):
+    """
+    Cambio de estado de un ítem: {"detalle": 12, "estado": "listo", "desde": "preparacion"}.
+    Pasa por PedidoDetalleViewSet igual que el PATCH (validaciones, 409 por
+    expected_estado, planificador y eventos), sin volver a validar el token.
+    """
+    close_old_connections()
+    base_datos_actual.set(sesion.sucursal.base_datos or None)
+    try:
+        detalle = comando.get('detalle')
+        if not str(detalle).isdigit() or not comando.get('estado'):
+            return {'status': 400, 'body': {'error': "Se requieren 'detalle' y 'estado'."}}
+        cuerpo = {'estado': comando['estado']}
+        if comando.get('desde'):
+            cuerpo['expected_estado'] = comando['desde']
+        operacion = {'method': 'PATCH', 'url': f'/api/detalles-pedido/{detalle}/', 'body': cuerpo}
+        response = ejecutar_operacion(operacion, sesion.user, sesion.token, sesion.meta, sesion.sucursal)
+        return {'status': response.status_code, 'body': response.data}
+    finally:
+        close_old_connections()
+
+
+async def _enviar(send, datos):
+    await send({'type': 'websocket.send', 'text': json.dumps(datos, cls=JSONEncoder)})
+
+
+async def _cerrar(send, codigo, error=None):
+    if error:
+        await _enviar(send, {'tipo': 'error', 'error': error})
+    await send({'type': 'websocket.close', 'code': codigo})
+
+
+def _leer(mensaje):
+    """ Mensaje de texto JSON del cliente como dict (o None si no lo es). """
+    try:
+        datos = json.loads(mensaje.get('text') or mensaje.get('bytes') or '')
+    except ValueError:
+        return None
+    return datos if isinstance(datos, dict) else None
+
+
+async def _reenviar_eventos(listener, send):
+    """ Pasa al socket los eventos SSE encolados para este listener. """
+    manager = get_listener_manager()
+    with manager.lock:
+        por_canal = listener.channel_items
+        desborde = listener.overflow
+        listener.aevent.clear()
+        listener.channel_items = {}
+        listener.overflow = False
+    for eventos in por_canal.values():
+        for evento in eventos:
+            await _enviar(send, {'tipo': 'evento', 'evento': evento.type, 'datos': json.loads(evento.data)})
+    if desborde:
+        # Se perdieron eventos (cliente lento): que recargue /api/pedidos/
+        await _enviar(send, {'tipo': 'desborde'})
+
+
+async def cocina_ws(scope, receive, send):
+    """
+    WebSocket de las pantallas de cocina (ws://.../ws/cocina/), alternativa
+    opcional al SSE + PATCH por clic. Protocolo (JSON):
+
+      cliente -> {"token": "<access JWT>", "sucursal": 2}          (primer mensaje)
+      servidor -> {"tipo": "conectado", "sucursal": 2, "canal": "cocina-2"}
+      cliente -> {"ref": "a1", "detalle": 12, "estado": "listo", "desde": "preparacion"}
+      servidor -> {"tipo": "respuesta", "ref": "a1", "status": 200, "body": {...}}
+      servidor -> {"tipo": "evento", "evento": "nuevo_item", "datos": {...}}
+
+    Los eventos son los mismos que se envían por SSE al canal de cocina de la
+    sucursal (send_event de django_eventstream), así que no hay que publicarlos aparte.
+    """
+    mensaje = await receive()
+    if mensaje['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+
+    # El token va en el primer mensaje y no en la URL (las URLs quedan en los logs)
+    try:
+        mensaje = await asyncio.wait_for(receive(), ESPERA_AUTENTICACION)
+    except asyncio.TimeoutError:
+        await _cerrar(send, CIERRE_NO_AUTENTICADO, 'No se recibió el token.')
+        return
+    if mensaje['type'] == 'websocket.disconnect':
+        return
+    datos = _leer(mensaje)
+    if datos is None:
+        await _cerrar(send, CIERRE_INVALIDO, 'El primer mensaje debe ser JSON con el token.')
+        return
+    try:
+        sesion = await sync_to_async(autenticar)(datos, scope)
+    except APIException as e:
+        codigo = {401: CIERRE_NO_AUTENTICADO, 403: CIERRE_SIN_PERMISO}.get(e.status_code, CIERRE_INVALIDO)
+        await _cerrar(send, codigo, e.detail)
+        return
+
+    canal_cocina = canal('cocina', sesion.sucursal.pk)
+    listener = Listener()
+    listener.assign_loop()
+    listener.user_id = str(sesion.user.pk)
+    listener.channels = {canal_cocina}
+    manager = get_listener_manager()
+    manager.add_listener(listener)
+
+    recibir = asyncio.ensure_future(receive())
+    evento = asyncio.ensure_future(listener.aevent.wait())
+    try:
+        await _enviar(send, {'tipo': 'conectado', 'sucursal': sesion.sucursal.pk, 'canal': canal_cocina})
+        while True:
+            restante = max(sesion.vence - time.time(), 0)
+            hechos, _ = await asyncio.wait(
+                {recibir, evento}, timeout=restante, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not hechos:
+                await _cerrar(send, CIERRE_NO_AUTENTICADO, 'El token venció; vuelve a conectar.')
+                return
+
+            if evento in hechos:
+                await _reenviar_eventos(listener, send)
+                evento = asyncio.ensure_future(listener.aevent.wait())
+
+            if recibir in hechos:
+                mensaje = recibir.result()
+                if mensaje['type'] == 'websocket.disconnect':
+                    return
+                comando = _leer(mensaje)
+                if comando is None:
+                    respuesta = {'status': 400, 'body': {'error': 'Mensaje JSON inválido.'}}
+                elif comando.get('accion') == 'ping':
+                    respuesta = {'status': 200, 'body': 'pong'}
+                else:
+                    respuesta = await sync_to_async(ejecutar_comando)(sesion, comando)
+                ref = comando.get('ref') if comando else None
+                await _enviar(send, {'tipo': 'respuesta', 'ref': ref, **respuesta})
+                recibir = asyncio.ensure_future(receive())
+    finally:
+        recibir.cancel()
+        evento.cancel()
+        manager.remove_listener(listener)
@@ -0,0 +1,118 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+# Caché dedicada (ver CACHES['idempotencia'] en settings): su TIMEOUT es el TTL
+# de cada clave y MAX_ENTRIES la cota del almacén (las más viejas se descartan).
+IDEMPOTENCIA_CACHE = 'idempotencia'
+# Mientras la primera petición se procesa, la clave queda "en curso" solo este tiempo
+# (si el proceso muere a mitad, el cliente puede reintentar pasado este plazo).
+EN_CURSO_TTL = 30
+# Tras un error del servidor la clave queda bloqueada solo este tiempo: alcanza para frenar
+# los reintentos automáticos mientras el cliente revisa si el cambio se guardó (la mayoría
+# de los 500, como un deadlock, revierten todo), sin dejarla inutilizable por un día.
+FALLIDO_TTL = 5 * 60
+MAX_LARGO_CLAVE = 255
+# Cabeceras de la respuesta original que también se reproducen
+CABECERAS_REPRODUCIBLES = ('Location', 'ETag')
+
+
+def _huella(request):
+    """ Hash del cuerpo para detectar una misma clave reutilizada con otro contenido. """
+    cuerpo = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(cuerpo.encode('utf-8')).hexdigest()
+
+
+def _marcar_fallido(cache, clave_cache, huella):
+    """ Resultado desconocido: la clave queda ocupada (FALLIDO_TTL) sin respuesta que reproducir. """
+    cache.set(clave_cache, {'en_curso': False, 'fallido': True, 'huella': huella}, FALLIDO_TTL)
+
+
+def idempotente(metodo):
+    """
+    Decorador para acciones de un ViewSet (create/update) que acepta 'Idempotency-Key'.
+    La primera petición con una clave se ejecuta y su respuesta se guarda;
+    los reintentos con la misma clave reciben esa respuesta sin volver a ejecutar nada.
+    Los rechazos del cliente (4xx) liberan la clave; un error del servidor la deja
+    ocupada, porque los cambios pudieron confirmarse antes de fallar.
+    Sin cabecera, la acción se ejecuta como siempre.
+    """
+    @wraps(metodo)
+    def envoltura(self, request, *args, **kwargs):
+        clave = request.headers.get('Idempotency-Key')
+        if not clave:
+            return metodo(self, request, *args, **kwargs)
+        if len(clave) > MAX_LARGO_CLAVE:
+            return Response(
+                {'error': f'Idempotency-Key no puede superar {MAX_LARGO_CLAVE} caracteres.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache = caches[IDEMPOTENCIA_CACHE]
+        # La clave es por usuario y endpoint: dos tablets no pueden pisarse entre sí
+        clave_cache = f"idem:{request.user.pk}:{request.method}:{request.path}:{clave}"
+        huella = _huella(request)
+
+        guardado = cache.get(clave_cache)
+        if guardado is None and not cache.add(clave_cache, {'en_curso': True, 'huella': huella}, EN_CURSO_TTL):
+            # Otra petición con la misma clave se registró justo antes que nosotros
+            guardado = cache.get(clave_cache)
+
+        if guardado is not None:
+            if guardado['huella'] != huella:
+                return Response(
+                    {'error': 'Idempotency-Key ya usada con un contenido distinto.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if guardado.get('fallido'):
+                return Response(
+                    {'error': 'La petición original con esta Idempotency-Key falló y pudo haberse aplicado. '
+                              'Revisa el estado antes de reintentar con una clave nueva.',
+                     'codigo': 'idempotencia_fallida'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            if guardado['en_curso']:
+                return Response(
+                    {'error': 'Una petición con esta Idempotency-Key todavía se está procesando.'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            response = Response(guardado['data'], status=guardado['status'], headers=guardado['headers'])
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = metodo(self, request, *args, **kwargs)
+        except APIException as e:
+            if e.status_code >= 500:
+                _marcar_fallido(cache, clave_cache, huella)
+            else:
+                # Validación, permisos, 409 de estado: se rechazó antes de confirmar nada,
+                # el reintento vuelve a evaluarse
+                cache.delete(clave_cache)
+            raise
+        except Exception:
+            # Error inesperado: pudo ocurrir después del commit (pedido ya creado).
+            # La clave queda tomada (FALLIDO_TTL) para que el reintento no lo duplique.
+            _marcar_fallido(cache, clave_cache, huella)
+            raise
+
+        if status.is_success(response.status_code):
+            cache.set(clave_cache, {
+                'en_curso': False,
+                'huella': huella,
+                'status': response.status_code,
+                'data': response.data,
+                'headers': {k: response[k] for k in CABECERAS_REPRODUCIBLES if response.has_header(k)},
+            })
+        elif status.is_server_error(response.status_code):
+            _marcar_fallido(cache, clave_cache, huella)
+        else:
+            cache.delete(clave_cache)
+        return response
+
+    return envoltura
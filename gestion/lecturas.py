@@ -0,0 +1,141 @@
+# Camino rápido de lectura para los listados más consultados (cocina, salón, menú).
+#
+# Arma directamente los dicts que devolverían PedidoReadSerializer (o
+# PedidoCocinaSerializer), MesaWithPedidosSerializer y CategoriaSerializer, pero con .values()
+# (sin instanciar modelos ni serializers anidados por fila) y una consulta
+# por nivel. La salida es idéntica: ver `python manage.py benchmark_lecturas`.
+# Si se agrega un campo a esos serializers, hay que agregarlo también aquí.
+from rest_framework import serializers
+
+from .models import Mesa, Producto, Pedido, PedidoDetalle
+
+# Mismos campos DRF que usan los serializers, para formatear exactamente igual
+_precio = serializers.DecimalField(max_digits=10, decimal_places=2)
+_fecha = serializers.DateTimeField()
+_estados_mesa = dict(Mesa.ESTADO_CHOICES)
+
+CAMPOS_PRODUCTO = (
+    'id', 'nombre', 'descripcion', 'precio', 'categoria__nombre',
+    'disponible', 'categoria__estacion', 'tiempo_preparacion', 'stock',
+)
+
+
+def _producto(fila, prefijo=''):
+    """ Igual que ProductoSerializer, a partir de una fila de .values(). """
+    return {
+        'id': fila[prefijo + 'id'],
+        'nombre': fila[prefijo + 'nombre'],
+        'descripcion': fila[prefijo + 'descripcion'],
+        'precio': _precio.to_representation(fila[prefijo + 'precio']),
+        'categoria': fila[prefijo + 'categoria__nombre'],
+        'disponible': fila[prefijo + 'disponible'],
+        'estacion': fila[prefijo + 'categoria__estacion'],
+        'tiempo_preparacion': fila[prefijo + 'tiempo_preparacion'],
+        'stock': fila[prefijo + 'stock'],
+    }
+
+
+def _mesa_str(numero, estado):
+    """ Igual que Mesa.__str__ (lo que muestra el StringRelatedField 'mesa'). """
+    return f"Mesa #{numero} - {_estados_mesa.get(estado, estado)}"
+
+
+def _detalles_por_pedido(pedido_ids, cocina=False):
+    """
+    Detalles (PedidoDetalleReadSerializer) de varios pedidos en una sola consulta.
+    cocina=True: como PedidoDetalleCocinaSerializer, sin join a Producto/Categoria.
+    """
+    campos_producto = [] if cocina else ['producto__' + campo for campo in CAMPOS_PRODUCTO]
+    filas = (
+        PedidoDetalle.objects
+        .filter(pedido_id__in=pedido_ids)
+        .order_by('pk')
+        .values('id', 'pedido_id', 'producto_id', 'producto_nombre', 'estacion', 'cantidad', 'nota',
+                'precio_unitario', 'estado', *campos_producto)
+    )
+    productos = {} # El mismo producto se formatea una sola vez
+    por_pedido = {}
+    for fila in filas:
+        producto_id = fila['producto_id']
+        if cocina:
+            producto = producto_id
+        else:
+            if producto_id not in productos:
+                productos[producto_id] = _producto(fila, 'producto__')
+            producto = productos[producto_id]
+        por_pedido.setdefault(fila['pedido_id'], []).append({
+            'id': fila['id'],
+            'producto': producto,
+            'producto_nombre': fila['producto_nombre'],
+            'estacion': fila['estacion'],
+            'cantidad': fila['cantidad'],
+            'nota': fila['nota'],
+            'precio_unitario': _precio.to_representation(fila['precio_unitario']),
+            'estado': fila['estado'],
+        })
+    return por_pedido
+
+
+def _pedido(fila, mesa, detalles):
+    return {
+        'id': fila['id'],
+        'mesa': mesa,
+        'fecha_hora': _fecha.to_representation(fila['fecha_hora']),
+        'estado': fila['estado'],
+        'detalles': detalles,
+    }
+
+
+def pedidos(queryset, cocina=False):
+    """
+    Lista de pedidos como PedidoReadSerializer(many=True), o PedidoCocinaSerializer
+    con cocina=True. Respeta filtros y orden del queryset.
+    """
+    filas = list(queryset.values('id', 'fecha_hora', 'estado', 'mesa__numero', 'mesa__estado'))
+    detalles = _detalles_por_pedido([fila['id'] for fila in filas], cocina)
+    return [
+        _pedido(fila, _mesa_str(fila['mesa__numero'], fila['mesa__estado']), detalles.get(fila['id'], []))
+        for fila in filas
+    ]
+
+
+def mesas(queryset):
+    """ Lista de mesas como MesaWithPedidosSerializer(many=True). """
+    filas = list(queryset.values('id', 'numero', 'estado'))
+    mesa_ids = [fila['id'] for fila in filas]
+    # Mismo orden que mesa.pedidos.all() (ordering del modelo Pedido)
+    filas_pedidos = list(
+        Pedido.objects.filter(mesa_id__in=mesa_ids)
+        .order_by(*Pedido._meta.ordering)
+        .values('id', 'mesa_id', 'fecha_hora', 'estado')
+    )
+    detalles = _detalles_por_pedido([fila['id'] for fila in filas_pedidos])
+
+    pedidos_por_mesa = {}
+    nombres = {fila['id']: _mesa_str(fila['numero'], fila['estado']) for fila in filas}
+    for fila in filas_pedidos:
+        pedidos_por_mesa.setdefault(fila['mesa_id'], []).append(
+            _pedido(fila, nombres[fila['mesa_id']], detalles.get(fila['id'], []))
+        )
+    return [
+        {'id': fila['id'], 'numero': fila['numero'], 'estado': fila['estado'],
+         'pedidos': pedidos_por_mesa.get(fila['id'], [])}
+        for fila in filas
+    ]
+
+
+def categorias(queryset):
+    """ Lista de categorías con sus productos como CategoriaSerializer(many=True). """
+    filas = list(queryset.values('id', 'nombre'))
+    productos = {}
+    for fila in (
+        Producto.objects
+        .filter(categoria_id__in=[fila['id'] for fila in filas])
+        .order_by('pk')
+        .values('categoria_id', *CAMPOS_PRODUCTO)
+    ):
+        productos.setdefault(fila['categoria_id'], []).append(_producto(fila))
+    return [
+        {'id': fila['id'], 'nombre': fila['nombre'], 'productos': productos.get(fila['id'], [])}
+        for fila in filas
+    ]
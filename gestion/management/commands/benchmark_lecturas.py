@@ -0,0 +1,71 @@
+import time
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from gestion import lecturas
+from gestion.models import Mesa, Categoria, Pedido
+from gestion.renderers import ORJSONRenderer
+from gestion.serializers import (
+    MesaWithPedidosSerializer,
+    CategoriaSerializer,
+    PedidoReadSerializer,
+    PedidoCocinaSerializer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara los serializers DRF de mesas, menú y pedidos con el camino rápido "
+        "de gestion/lecturas.py: verifica que el JSON sea idéntico y mide los tiempos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=20, help='Veces que se mide cada camino.')
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        pedidos_activos = Pedido.objects.exclude(estado='pagado').order_by('fecha_hora')
+        casos = [
+            # (nombre, serializer actual, función rápida, queryset) - mismos querysets que los ViewSets
+            ('mesas (salón)', MesaWithPedidosSerializer, lecturas.mesas, Mesa.objects.all().order_by('numero')),
+            ('categorias (menú)', CategoriaSerializer, lecturas.categorias, Categoria.objects.all().order_by('id')),
+            ('pedidos (mesero)', PedidoReadSerializer, lecturas.pedidos, pedidos_activos),
+            ('pedidos (cocina)', PedidoCocinaSerializer, partial(lecturas.pedidos, cocina=True),
+             pedidos_activos.filter(detalles__estacion='cocina').distinct()),
+        ]
+        drf_json = JSONRenderer()
+        rapido_json = ORJSONRenderer()
+
+        for nombre, serializer_class, rapido, queryset in casos:
+            def actual():
+                return drf_json.render(serializer_class(queryset.all(), many=True).data)
+
+            def optimizado():
+                return rapido_json.render(rapido(queryset.all()))
+
+            salida_actual, salida_rapida = actual(), optimizado()
+            if salida_actual != salida_rapida:
+                raise CommandError(
+                    f"{nombre}: la salida no coincide.\n"
+                    f"  actual:  {salida_actual[:300]!r}\n  rápido:  {salida_rapida[:300]!r}"
+                )
+
+            t_actual = self.medir(actual, repeticiones)
+            t_rapido = self.medir(optimizado, repeticiones)
+            self.stdout.write(
+                f"{nombre:<20} {len(salida_actual):>9} bytes  idéntico  "
+                f"actual {t_actual * 1000:8.2f} ms  rápido {t_rapido * 1000:8.2f} ms  "
+                f"x{t_actual / t_rapido if t_rapido else 0:.1f}"
+            )
+
+    def medir(self, funcion, repeticiones):
+        """ Mejor tiempo de varias ejecuciones (el menos afectado por ruido). """
+        mejor = None
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            duracion = time.perf_counter() - inicio
+            mejor = duracion if mejor is None else min(mejor, duracion)
+        return mejor
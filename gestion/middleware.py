@@ -0,0 +1,103 @@
+from django.middleware.gzip import GZipMiddleware
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .replicas import marcar_escritura
+from . import throttling
+from .sucursales import base_datos_actual, sucursales_de
+
+# Clave de sesión con la sucursal elegida en el admin (acción de SucursalAdmin)
+SESION_SUCURSAL_ADMIN = 'sucursal_admin'
+
+
+class GZipAPIMiddleware(GZipMiddleware):
+    """
+    Comprime con gzip las respuestas normales de la API (listados de mesas, menú, pedidos)
+    cuando el cliente lo acepta. No toca las respuestas en streaming (SSE de /api/events/),
+    que deben llegar al cliente apenas se envían.
+    """
+    def process_response(self, request, response):
+        if response.streaming:
+            return response
+        return super().process_response(request, response)
+
+
+class SucursalMiddleware:
+    """
+    Limpia la base de datos de sucursal elegida en el request anterior
+    (los hilos del servidor se reutilizan entre requests). En el admin
+    (sesión de Django, sin X-Sucursal) usa la sucursal elegida con la acción
+    "Administrar esta sucursal", si el usuario sigue teniendo acceso.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def base_de_admin(self, request):
+        sucursal_id = request.session.get(SESION_SUCURSAL_ADMIN) if hasattr(request, 'session') else None
+        if sucursal_id is None or not request.path.startswith('/admin/'):
+            return None
+        sucursal = sucursales_de(request.user).filter(pk=sucursal_id).first()
+        if sucursal is None:
+            return None
+        return sucursal.base_datos or None
+
+    def __call__(self, request):
+        token = base_datos_actual.set(self.base_de_admin(request))
+        try:
+            return self.get_response(request)
+        finally:
+            base_datos_actual.reset(token)
+
+
+class EscrituraRecienteMiddleware:
+    """
+    Después de un POST/PUT/PATCH/DELETE exitoso, las lecturas de ese usuario
+    vuelven a la base principal por unos segundos (read-your-writes con réplicas).
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+            # DRF deja en request.user el usuario autenticado por JWT
+            marcar_escritura(getattr(request, 'user', None))
+        return response
+
+
+class EnCursoMiddleware:
+    """
+    Cuenta las requests en curso del proceso; con muchas, SobrecargaThrottle
+    rechaza las de menor prioridad (gestion/throttling.py).
+    Las respuestas en streaming (SSE) dejan de contar al empezar a enviarse.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        throttling.entrar()
+        try:
+            return self.get_response(request)
+        finally:
+            throttling.salir()
+
+
+class TokenSSEMiddleware:
+    """
+    Autentica las conexiones SSE (/api/events/) con el access token de la query
+    (?_sse_token=...), porque EventSource no puede mandar la cabecera Authorization.
+    django_eventstream usa request.user para los permisos de cada canal.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.GET.get('_sse_token')
+        if token and request.path.startswith('/api/events/'):
+            jwt = JWTAuthentication()
+            try:
+                request.user = jwt.get_user(jwt.get_validated_token(token))
+            except (InvalidToken, AuthenticationFailed):
+                pass # Queda anónimo: los canales de sucursal responden 'forbidden'
+        return self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0005_turno'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='tiempo_preparacion',
+            field=models.PositiveIntegerField(default=10, verbose_name='Tiempo de Preparación (min)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0006_producto_tiempo_preparacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='stock',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Stock'),
+        ),
+    ]
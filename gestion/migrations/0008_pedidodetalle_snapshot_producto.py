@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0007_producto_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedidodetalle',
+            name='estacion',
+            field=models.CharField(blank=True, choices=[('cocina', 'Cocina'), ('bar', 'Bar/Mesero')], max_length=20, verbose_name='Estación (al pedir)'),
+        ),
+        migrations.AddField(
+            model_name='pedidodetalle',
+            name='producto_nombre',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Nombre del Producto (al pedir)'),
+        ),
+        migrations.AddIndex(
+            model_name='pedidodetalle',
+            index=models.Index(fields=['estacion', 'estado'], name='detalle_estacion_estado_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:23
+
+from django.db import migrations
+
+# Filas por lote: cada lote se guarda en su propia transacción (atomic = False),
+# así en tablas grandes no se bloquea todo PedidoDetalle durante la migración.
+TAMANO_LOTE = 1000
+
+
+def copiar_datos_producto(apps, schema_editor):
+    PedidoDetalle = apps.get_model('gestion', 'PedidoDetalle')
+    db_alias = schema_editor.connection.alias
+    ultimo_id = 0
+    while True:
+        lote = list(
+            PedidoDetalle.objects.using(db_alias)
+            .filter(pk__gt=ultimo_id, producto_nombre='')
+            .select_related('producto__categoria')
+            .order_by('pk')[:TAMANO_LOTE]
+        )
+        if not lote:
+            break
+        for detalle in lote:
+            detalle.producto_nombre = detalle.producto.nombre
+            detalle.estacion = detalle.producto.categoria.estacion
+        PedidoDetalle.objects.using(db_alias).bulk_update(lote, ['producto_nombre', 'estacion'])
+        ultimo_id = lote[-1].pk
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('gestion', '0008_pedidodetalle_snapshot_producto'),
+    ]
+
+    operations = [
+        migrations.RunPython(copiar_datos_producto, migrations.RunPython.noop),
+    ]
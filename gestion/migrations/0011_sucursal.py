@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def asignar_sucursal_principal(apps, schema_editor):
+    """ Los datos existentes (un solo local) pasan a la sucursal 'Principal'. """
+    Sucursal = apps.get_model('gestion', 'Sucursal')
+    db_alias = schema_editor.connection.alias
+    sucursal, _ = Sucursal.objects.using(db_alias).get_or_create(nombre='Principal')
+    for nombre_modelo in ('Mesa', 'Categoria', 'Pedido', 'Turno'):
+        modelo = apps.get_model('gestion', nombre_modelo)
+        modelo.objects.using(db_alias).filter(sucursal__isnull=True).update(sucursal=sucursal)
+
+
+def sucursal_no_nula(model_name, related_name):
+    return migrations.AlterField(
+        model_name=model_name,
+        name='sucursal',
+        field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name=related_name, to='gestion.sucursal', verbose_name='Sucursal'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion', '0010_pedido_indices_fecha'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sucursal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True, verbose_name='Nombre')),
+                ('base_datos', models.CharField(blank=True, max_length=50, verbose_name='Base de Datos (alias)')),
+            ],
+            options={
+                'verbose_name': 'Sucursal',
+                'verbose_name_plural': 'Sucursales',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='pedido',
+            name='pedido_estado_fecha_idx',
+        ),
+        migrations.AlterField(
+            model_name='categoria',
+            name='nombre',
+            field=models.CharField(max_length=100, verbose_name='Nombre'),
+        ),
+        migrations.AlterField(
+            model_name='mesa',
+            name='numero',
+            field=models.IntegerField(verbose_name='Número de Mesa'),
+        ),
+        migrations.AddField(
+            model_name='sucursal',
+            name='empleados',
+            field=models.ManyToManyField(blank=True, related_name='sucursales', to=settings.AUTH_USER_MODEL, verbose_name='Empleados'),
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='categorias', to='gestion.sucursal', verbose_name='Sucursal'),
+        ),
+        migrations.AddField(
+            model_name='mesa',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='mesas', to='gestion.sucursal', verbose_name='Sucursal'),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='pedidos', to='gestion.sucursal', verbose_name='Sucursal'),
+        ),
+        migrations.AddField(
+            model_name='turno',
+            name='sucursal',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='turnos', to='gestion.sucursal', verbose_name='Sucursal'),
+        ),
+        migrations.RunPython(asignar_sucursal_principal, migrations.RunPython.noop),
+        sucursal_no_nula('categoria', 'categorias'),
+        sucursal_no_nula('mesa', 'mesas'),
+        sucursal_no_nula('pedido', 'pedidos'),
+        sucursal_no_nula('turno', 'turnos'),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['sucursal', 'estado', 'fecha_hora'], name='pedido_sucursal_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='turno',
+            index=models.Index(fields=['sucursal', 'estado'], name='turno_sucursal_estado_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='categoria',
+            constraint=models.UniqueConstraint(fields=('sucursal', 'nombre'), name='categoria_nombre_unico_por_sucursal'),
+        ),
+        migrations.AddConstraint(
+            model_name='mesa',
+            constraint=models.UniqueConstraint(fields=('sucursal', 'numero'), name='mesa_numero_unico_por_sucursal'),
+        ),
+    ]
@@ -2,6 +2,21 @@ from django.utils import timezone
 from django.db import models
 from django.contrib.auth.models import User
 
+class Sucursal(models.Model):
+    nombre = models.CharField(max_length=100, unique=True, verbose_name="Nombre")
+    # Alias de settings.DATABASES donde viven los datos de esta sucursal (vacío = 'default')
+    base_datos = models.CharField(max_length=50, blank=True, verbose_name="Base de Datos (alias)")
+    # Usuarios que trabajan en la sucursal (ver gestion.sucursales.sucursales_de)
+    empleados = models.ManyToManyField(User, blank=True, related_name='sucursales', verbose_name="Empleados")
+
+    def __str__(self):
+        return self.nombre
+
+    class Meta:
+        verbose_name = "Sucursal"
+        verbose_name_plural = "Sucursales"
+        ordering = ['nombre']
+
 class Mesa(models.Model):
     ESTADO_CHOICES = [
         ('disponible', 'Disponible'),
@@ -9,7 +24,8 @@ class Mesa(models.Model):
         ('pagando', 'Pagando'),
     ]
 
-    numero = models.IntegerField(unique=True, verbose_name="Número de Mesa")
+    sucursal = models.ForeignKey(Sucursal, related_name='mesas', on_delete=models.PROTECT, verbose_name="Sucursal")
+    numero = models.IntegerField(verbose_name="Número de Mesa")
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='disponible', verbose_name="Estado")
 
     def __str__(self):
@@ -19,13 +35,18 @@ class Mesa(models.Model):
         verbose_name = "Mesa"
         verbose_name_plural = "Mesas"
         ordering = ['numero']
+        constraints = [
+            # El número de mesa es único dentro de cada sucursal (y el índice empieza por la sucursal)
+            models.UniqueConstraint(fields=['sucursal', 'numero'], name='mesa_numero_unico_por_sucursal'),
+        ]
 
 class Categoria(models.Model):
     STATION_CHOICES = [
         ('cocina', 'Cocina'),
         ('bar', 'Bar/Mesero'),
     ]
-    nombre = models.CharField(max_length=100, unique=True, verbose_name="Nombre")
+    sucursal = models.ForeignKey(Sucursal, related_name='categorias', on_delete=models.PROTECT, verbose_name="Sucursal")
+    nombre = models.CharField(max_length=100, verbose_name="Nombre")
 
     estacion = models.CharField(max_length=20, choices=STATION_CHOICES, default='cocina', verbose_name="Estación de Preparación")
 
@@ -35,6 +56,9 @@ class Categoria(models.Model):
     class Meta:
         verbose_name = "Categoría"
         verbose_name_plural = "Categorías"
+        constraints = [
+            models.UniqueConstraint(fields=['sucursal', 'nombre'], name='categoria_nombre_unico_por_sucursal'),
+        ]
 
 class Producto(models.Model):
     nombre = models.CharField(max_length=100, verbose_name="Nombre")
@@ -42,6 +66,10 @@ class Producto(models.Model):
     precio = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Precio")
     categoria = models.ForeignKey(Categoria, related_name='productos', on_delete=models.CASCADE, verbose_name="Categoría")
     disponible = models.BooleanField(default=True, verbose_name="¿Está disponible?")
+    # Vacío = sin control de stock. Se descuenta al crear pedidos y al llegar a 0 el producto deja de estar disponible
+    stock = models.PositiveIntegerField(null=True, blank=True, verbose_name="Stock")
+    # Usado por el planificador de cocina (gestion/planificador.py) para ordenar las comandas
+    tiempo_preparacion = models.PositiveIntegerField(default=10, verbose_name="Tiempo de Preparación (min)")
 
     def __str__(self):
         return f"{self.nombre} - ${self.precio}"
@@ -59,6 +87,8 @@ class Pedido(models.Model):
         ('pagado', 'Pagado'),
     ]
 
+    # Copia de mesa.sucursal: permite filtrar/indexar pedidos por sucursal sin join con Mesa
+    sucursal = models.ForeignKey(Sucursal, related_name='pedidos', on_delete=models.PROTECT, verbose_name="Sucursal")
     mesa = models.ForeignKey(Mesa, related_name='pedidos', on_delete=models.CASCADE, verbose_name="Mesa")
     fecha_hora = models.DateTimeField(auto_now_add=True, verbose_name="Fecha y Hora")
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='recibido', verbose_name="Estado del Pedido")
@@ -71,6 +101,11 @@ class Pedido(models.Model):
         verbose_name = "Pedido"
         verbose_name_plural = "Pedidos"
         ordering = ['-fecha_hora']
+        indexes = [
+            # Listados por fecha (admin, historial) y pedidos activos ordenados por llegada
+            models.Index(fields=['fecha_hora'], name='pedido_fecha_hora_idx'),
+            models.Index(fields=['sucursal', 'estado', 'fecha_hora'], name='pedido_sucursal_estado_idx'),
+        ]
 
 class PedidoDetalle(models.Model):
    
@@ -89,12 +124,21 @@ class PedidoDetalle(models.Model):
    
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='recibido', verbose_name="Estado del Detalle")
 
+    # Copia del producto al momento del pedido: la cocina y los reportes leen esto sin joins
+    # y no cambia si después se renombra el producto o se mueve de estación.
+    producto_nombre = models.CharField(max_length=100, blank=True, verbose_name="Nombre del Producto (al pedir)")
+    estacion = models.CharField(max_length=20, choices=Categoria.STATION_CHOICES, blank=True, verbose_name="Estación (al pedir)")
+
     def __str__(self):
-        return f"{self.cantidad}x {self.producto.nombre} en Pedido #{self.pedido.id}"
+        return f"{self.cantidad}x {self.producto_nombre or self.producto.nombre} en Pedido #{self.pedido_id}"
 
     class Meta:
         verbose_name = "Detalle de Pedido"
         verbose_name_plural = "Detalles de Pedidos"
+        indexes = [
+            # Vista de cocina: ítems de una estación en cierto estado
+            models.Index(fields=['estacion', 'estado'], name='detalle_estacion_estado_idx'),
+        ]
 
 class Turno(models.Model):
     ESTADO_CHOICES = [
@@ -102,6 +146,8 @@ class Turno(models.Model):
         ('cerrado', 'Cerrado'),
     ]
 
+    sucursal = models.ForeignKey(Sucursal, related_name='turnos', on_delete=models.PROTECT, verbose_name="Sucursal")
+
     fecha_inicio = models.DateTimeField(default=timezone.now, verbose_name="Fecha y Hora de Inicio")
     fecha_fin = models.DateTimeField(null=True, blank=True, verbose_name="Fecha y Hora de Fin")
     abierto_por = models.ForeignKey(
@@ -121,4 +167,7 @@ class Turno(models.Model):
     class Meta:
         verbose_name = "Turno"
         verbose_name_plural = "Turnos"
-        ordering = ['-fecha_inicio']
\ No newline at end of file
+        ordering = ['-fecha_inicio']
+        indexes = [
+            models.Index(fields=['sucursal', 'estado'], name='turno_sucursal_estado_idx'),
+        ]
\ No newline at end of file
@@ -1,6 +1,14 @@
-
 from rest_framework.permissions import BasePermission
 
+def grupos_de(user):
+    """
+    Nombres de los grupos del usuario. Se consultan una sola vez por objeto user
+    y se reutilizan en los siguientes chequeos (varios permisos, operaciones de /api/batch/).
+    """
+    if not hasattr(user, '_grupos_cache'):
+        user._grupos_cache = set(user.groups.values_list('name', flat=True))
+    return user._grupos_cache
+
 class IsMeseroUser(BasePermission):
     """
     Permite el acceso a superusuarios o a usuarios en el grupo 'Meseros'.
@@ -10,7 +18,7 @@ class IsMeseroUser(BasePermission):
         if request.user.is_superuser:
             return True
         # Si no, verifica si pertenece al grupo 'Meseros'
-        return request.user.groups.filter(name='Meseros').exists()
+        return 'Meseros' in grupos_de(request.user)
 
 class IsCocinaUser(BasePermission):
     """
@@ -19,5 +27,4 @@ class IsCocinaUser(BasePermission):
     def has_permission(self, request, view):
         if request.user.is_superuser:
             return True
-        return request.user.groups.filter(name='Cocina').exists()
-    
\ No newline at end of file
+        return 'Cocina' in grupos_de(request.user)
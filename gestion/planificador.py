@@ -0,0 +1,269 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from .models import PedidoDetalle
+
+# Cada cuánto se vuelve a leer la BD por si hubo cambios que no pasaron por la API
+# (admin, otro proceso del servidor). Entre medio, todo es incremental.
+RESYNC_SEGUNDOS = 60
+
+# El planificador vive en la memoria de cada proceso. Con varios procesos (gunicorn -w N)
+# hay que configurar este caché compartido (Redis/Memcached): cada cambio sube un contador
+# allí y los demás procesos recargan en cuanto lo ven. Sin él, un proceso se entera de
+# los cambios de los otros recién en el siguiente resync (hasta RESYNC_SEGUNDOS tarde).
+CACHE_COMPARTIDO = 'planificador'
+
+
+class PlanificadorCocina:
+    """
+    Cola de comandas en memoria de una sucursal, una cola de prioridad (heap) por estación.
+
+    Prioridad de un ítem = momento en que conviene empezarlo:
+        objetivo del pedido = llegada + mayor tiempo de preparación del pedido
+        inicio sugerido     = objetivo - tiempo de preparación del ítem
+    Así los pedidos más antiguos van primero, los platos largos empiezan antes
+    y todos los platos de un mismo pedido (una mesa) terminan a la vez.
+
+    Se actualiza al crear pedidos y al cambiar estados; no se recalcula por request.
+    Las entradas viejas del heap se descartan de forma perezosa (por 'seq').
+    Las recargas desde la BD corren en un hilo aparte (salvo la primera) y nunca
+    dentro del on_commit de quien escribe.
+    """
+    def __init__(self, sucursal_id, base_datos=None):
+        self.sucursal_id = sucursal_id
+        self.base_datos = base_datos or 'default'
+        self._lock = threading.Lock()
+        self._lock_recarga = threading.Lock()  # Una recarga a la vez
+        self._colas = {}    # estacion -> heap de (inicio, seq, detalle_id) para ítems 'recibido'
+        self._tickets = {}  # detalle_id -> ticket (dict)
+        self._seq = itertools.count()
+        self._cargado_en = None
+        self._version = None      # Contador compartido visto en la última carga
+        self._durante_recarga = None  # Cambios aplicados mientras corre una recarga (se reaplican)
+        self._recarga = None      # Hilo de la recarga en curso
+
+    # --- API PÚBLICA (usada por serializers y vistas) ---
+    def registrar_pedido(self, pedido, detalles):
+        """ Agrega los ítems de un pedido recién creado (con su producto cargado). """
+        self._aplicar(self._agregar, pedido, detalles)
+
+    def actualizar_detalle(self, detalle_id, estado):
+        """ Refleja el cambio de estado de un ítem. """
+        self._aplicar(self._actualizar, detalle_id, estado)
+
+    def quitar_pedido(self, pedido_id):
+        """ Saca de las colas todos los ítems de un pedido (ej: pagado). """
+        self._aplicar(self._quitar, pedido_id)
+
+    def siguientes(self, estacion, limite=10):
+        """ Próximos ítems a empezar en la estación, en orden de prioridad. """
+        self._revisar()
+        with self._lock:
+            cola = self._compactar(estacion)
+            entradas = heapq.nsmallest(limite, (e for e in cola if self._vigente(e)))
+            return [self._serializar(self._tickets[detalle_id]) for _, _, detalle_id in entradas]
+
+    def en_preparacion(self, estacion):
+        """ Ítems que la estación ya empezó, en el mismo orden de prioridad. """
+        self._revisar()
+        with self._lock:
+            tickets = sorted(
+                (t for t in self._tickets.values() if t['estacion'] == estacion and t['estado'] == 'preparacion'),
+                key=lambda t: t['inicio']
+            )
+            return [self._serializar(t) for t in tickets]
+
+    def carga(self):
+        """ Minutos de trabajo pendientes (recibido + preparación) por estación. """
+        self._revisar()
+        with self._lock:
+            carga = {}
+            for t in self._tickets.values():
+                carga[t['estacion']] = carga.get(t['estacion'], 0) + t['tiempo_preparacion'] * t['cantidad']
+            return carga
+
+    # --- RECARGAS ---
+    def _clave_version(self):
+        return f"planificador:{self.sucursal_id}"
+
+    def _version_compartida(self):
+        if CACHE_COMPARTIDO not in settings.CACHES:
+            return None
+        return caches[CACHE_COMPARTIDO].get(self._clave_version(), 0)
+
+    def _avisar_cambio(self):
+        """ Sube el contador compartido para que los demás procesos recarguen. """
+        if CACHE_COMPARTIDO not in settings.CACHES:
+            return
+        cache = caches[CACHE_COMPARTIDO]
+        cache.add(self._clave_version(), 0, None)
+        try:
+            version = cache.incr(self._clave_version())
+        except ValueError:
+            return
+        with self._lock:
+            # Si nadie más escribió desde lo último que vimos, no hace falta recargar por este cambio
+            if self._version is not None and version == self._version + 1:
+                self._version = version
+
+    def _aplicar(self, cambio, *args):
+        """ Aplica un cambio incremental. Nunca recarga: corre en el on_commit de quien escribió. """
+        with self._lock:
+            if self._durante_recarga is not None:
+                self._durante_recarga.append((cambio, args))
+            if self._cargado_en is not None:
+                cambio(*args)
+            # Si nunca se cargó, la primera carga ya lo leerá de la BD
+        self._avisar_cambio()
+
+    def _revisar(self):
+        """
+        Antes de leer: la primera vez carga en el momento; después, si otro proceso
+        cambió algo o pasó RESYNC_SEGUNDOS, recarga en segundo plano y se responde
+        con lo que ya hay en memoria.
+        """
+        if self._cargado_en is None:
+            with self._lock_recarga:
+                cargado = self._cargado_en is not None
+            if not cargado:
+                self._recargar()
+            return
+        version = self._version_compartida()
+        with self._lock:
+            vencido = (version is not None and version != self._version) or \
+                time.monotonic() - self._cargado_en >= RESYNC_SEGUNDOS
+            if not vencido or self._recarga is not None:
+                return
+            self._recarga = threading.Thread(target=self._recargar_en_segundo_plano, daemon=True)
+            self._recarga.start()
+
+    def _recargar_en_segundo_plano(self):
+        try:
+            self._recargar()
+        except Exception as e:
+            print(f"ERROR: No se pudo recargar el planificador de la sucursal {self.sucursal_id}: {e}")
+        finally:
+            with self._lock:
+                self._recarga = None
+            # El hilo es propio: cierra las conexiones que abrió
+            connections.close_all()
+
+    def _recargar(self):
+        """ Relee de la BD los ítems pendientes. La consulta corre sin el lock de las colas. """
+        with self._lock_recarga:
+            with self._lock:
+                self._durante_recarga = []
+            try:
+                version = self._version_compartida()
+                detalles = list(
+                    PedidoDetalle.objects.using(self.base_datos)
+                    .filter(pedido__sucursal_id=self.sucursal_id, estado__in=('recibido', 'preparacion'))
+                    .exclude(pedido__estado='pagado')
+                    .select_related('pedido__mesa', 'producto')
+                    .order_by('pedido_id', 'id')
+                )
+            except Exception:
+                with self._lock:
+                    self._durante_recarga = None
+                raise
+            por_pedido = {}
+            for detalle in detalles:
+                por_pedido.setdefault(detalle.pedido_id, []).append(detalle)
+            with self._lock:
+                self._colas = {}
+                self._tickets = {}
+                for items in por_pedido.values():
+                    self._agregar(items[0].pedido, items)
+                # Los cambios que llegaron mientras corría la consulta se vuelven a aplicar
+                # (son idempotentes si la consulta ya los había visto)
+                for cambio, args in self._durante_recarga:
+                    cambio(*args)
+                self._durante_recarga = None
+                self._version = version
+                self._cargado_en = time.monotonic()
+
+    # --- INTERNOS (siempre con el lock tomado) ---
+    def _actualizar(self, detalle_id, estado):
+        ticket = self._tickets.get(detalle_id)
+        if ticket is None:
+            return
+        if estado in ('listo', 'entregado'):
+            del self._tickets[detalle_id]
+        else:
+            ticket['estado'] = estado
+            if estado == 'recibido':
+                self._encolar(ticket)
+
+    def _quitar(self, pedido_id):
+        for detalle_id in [i for i, t in self._tickets.items() if t['pedido_id'] == pedido_id]:
+            del self._tickets[detalle_id]
+
+    def _agregar(self, pedido, detalles):
+        llegada = pedido.fecha_hora.timestamp()
+        objetivo = llegada + max(d.producto.tiempo_preparacion for d in detalles) * 60
+        for d in detalles:
+            if d.id in self._tickets:
+                continue
+            ticket = {
+                'detalle_id': d.id,
+                'pedido_id': pedido.id,
+                'mesa_numero': pedido.mesa.numero,
+                'producto_nombre': d.producto_nombre,
+                'cantidad': d.cantidad,
+                'nota': d.nota,
+                'estado': d.estado,
+                'estacion': d.estacion,
+                'tiempo_preparacion': d.producto.tiempo_preparacion,
+                'llegada': llegada,
+                'inicio': objetivo - d.producto.tiempo_preparacion * 60,
+                'seq': None,
+            }
+            self._tickets[d.id] = ticket
+            if ticket['estado'] == 'recibido':
+                self._encolar(ticket)
+
+    def _encolar(self, ticket):
+        ticket['seq'] = next(self._seq)
+        heapq.heappush(self._colas.setdefault(ticket['estacion'], []), (ticket['inicio'], ticket['seq'], ticket['detalle_id']))
+
+    def _vigente(self, entrada):
+        _, seq, detalle_id = entrada
+        ticket = self._tickets.get(detalle_id)
+        return ticket is not None and ticket['estado'] == 'recibido' and ticket['seq'] == seq
+
+    def _compactar(self, estacion):
+        # Descarta entradas viejas del tope y rehace el heap si la mayoría son viejas
+        cola = self._colas.get(estacion, [])
+        while cola and not self._vigente(cola[0]):
+            heapq.heappop(cola)
+        vigentes = [e for e in cola if self._vigente(e)]
+        if len(cola) > 2 * len(vigentes) + 32:
+            heapq.heapify(vigentes)
+            self._colas[estacion] = cola = vigentes
+        return cola
+
+    def _serializar(self, ticket):
+        datos = {k: v for k, v in ticket.items() if k not in ('llegada', 'inicio', 'seq')}
+        datos['llegada'] = datetime.fromtimestamp(ticket['llegada'], tz=dt_timezone.utc)
+        datos['inicio_sugerido'] = datetime.fromtimestamp(ticket['inicio'], tz=dt_timezone.utc)
+        return datos
+
+
+# Un planificador por sucursal, creados a demanda (uno por proceso)
+_planificadores = {}
+_planificadores_lock = threading.Lock()
+
+
+def planificador_de(sucursal):
+    """ Planificador de la sucursal (lo crea la primera vez). """
+    with _planificadores_lock:
+        if sucursal.pk not in _planificadores:
+            _planificadores[sucursal.pk] = PlanificadorCocina(sucursal.pk, sucursal.base_datos)
+        return _planificadores[sucursal.pk]
@@ -0,0 +1,29 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el renderer JSON de DRF
+    orjson = None
+
+# Los tipos que orjson no conoce (Decimal, fechas, lazy strings...) se convierten
+# con el mismo encoder de DRF, así el JSON sale igual con o sin orjson.
+_encoder = JSONEncoder()
+_opciones = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS if orjson else 0
+)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer que serializa con orjson (varias veces más rápido que json).
+    Para respuestas con sangría (API navegable) o si orjson no está instalado, usa el de DRF.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=_encoder.default, option=_opciones)
+        # Igual que DRF: U+2028/U+2029 van escapados (son fin de línea dentro de un <script>)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
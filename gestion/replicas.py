@@ -0,0 +1,50 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Segundos que las lecturas de un usuario siguen yendo a la base principal
+# después de que escribió (para que vea sus propios cambios aunque la réplica vaya atrasada)
+VENTANA_ESCRITURA = 5
+
+# Caché donde se marca quién escribió hace poco. Debe ser compartido entre procesos
+# (Redis/Memcached): la lectura siguiente puede caer en otro worker. Ver settings.CACHES.
+CACHE_ESCRITURAS = 'replicas'
+
+# True mientras corre código de solo lectura que puede ir a la réplica
+# (reportes, exportaciones, listados del admin, GET de salón/menú). Lo usa gestion.routers.ReplicaRouter.
+leer_de_replica = ContextVar('leer_de_replica', default=False)
+
+
+def replica_de(alias):
+    """ Alias de la réplica de lectura de una base (settings.REPLICAS_LECTURA), o None si no tiene. """
+    return getattr(settings, 'REPLICAS_LECTURA', {}).get(alias)
+
+
+@contextmanager
+def en_replica(activo=True):
+    """
+    Las lecturas dentro del bloque van a la réplica de la base que corresponda
+    (con o sin sucursal propia). Las escrituras siguen yendo a la principal.
+    Uso: `with en_replica(): ...` en reportes y exportaciones.
+    """
+    token = leer_de_replica.set(activo)
+    try:
+        yield
+    finally:
+        leer_de_replica.reset(token)
+
+
+def _clave(user):
+    return f"escritura-reciente:{user.pk}"
+
+
+def marcar_escritura(user):
+    """ Registra que el usuario acaba de escribir (ver VENTANA_ESCRITURA). """
+    if getattr(settings, 'REPLICAS_LECTURA', None) and user is not None and user.is_authenticated:
+        caches[CACHE_ESCRITURAS].set(_clave(user), True, VENTANA_ESCRITURA)
+
+
+def escribio_hace_poco(user):
+    return user is not None and user.is_authenticated and caches[CACHE_ESCRITURAS].get(_clave(user), False)
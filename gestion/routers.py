@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .replicas import leer_de_replica, replica_de
+from .sucursales import base_datos_actual
+
+# Modelos que siempre viven en la base principal (catálogo de sucursales)
+MODELOS_GLOBALES = {'sucursal', 'sucursal_empleados'}
+
+
+class SucursalRouter:
+    """
+    Envía las consultas de la app 'gestion' a la base de datos de la sucursal
+    del request (Sucursal.base_datos), si tiene una propia.
+    La base de cada sucursal se crea con `migrate --database=<alias>` y debe tener
+    su fila de Sucursal y los usuarios (las FKs no cruzan bases de datos).
+    """
+    def _base_sucursal(self, model):
+        if model._meta.app_label != 'gestion' or model._meta.model_name in MODELOS_GLOBALES:
+            return None
+        return base_datos_actual.get()
+
+    def db_for_read(self, model, **hints):
+        return self._base_sucursal(model)
+
+    def db_for_write(self, model, **hints):
+        return self._base_sucursal(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Una sucursal en su propia base sigue apuntando a su fila de Sucursal/usuarios
+        if 'gestion' in (obj1._meta.app_label, obj2._meta.app_label):
+            return True
+        return None
+
+
+class ReplicaRouter:
+    """
+    Manda las lecturas a la réplica (settings.REPLICAS_LECTURA) solo dentro de
+    replicas.en_replica() o de los ViewSets con LecturaReplicaMixin.
+    Va antes que SucursalRouter: toma la base que elegiría él y usa su réplica;
+    si esa base no tiene réplica no opina y decide SucursalRouter.
+    """
+    def __init__(self):
+        self.sucursal_router = SucursalRouter()
+
+    def db_for_read(self, model, **hints):
+        if not leer_de_replica.get():
+            return None
+        principal = self.sucursal_router.db_for_read(model, **hints) or DEFAULT_DB_ALIAS
+        # Dentro de una transacción se lee lo que ella misma escribió
+        if connections[principal].in_atomic_block:
+            return None
+        return replica_de(principal)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas se copian de la base principal: no se migran
+        if db in getattr(settings, 'REPLICAS_LECTURA', {}).values():
+            return False
+        return None
@@ -0,0 +1,91 @@
+import threading
+
+from django.db import connections
+from django.db.models import Count
+from django_eventstream import send_event
+
+from .models import Mesa, PedidoDetalle
+from .sucursales import canal
+
+# Los cambios de una mesa se juntan durante este tiempo antes de publicarse:
+# una ráfaga (pedido con varios ítems, cocina marcando varios platos) sale como un solo evento
+VENTANA_SEGUNDOS = 0.5
+
+
+def estado_mesas(mesas):
+    """
+    Estado compacto de las mesas de un queryset: estado, ítems pendientes
+    (recibido/preparación) e ítems listos para servir. Dos consultas en total.
+    """
+    filas = list(mesas.values('id', 'numero', 'estado'))
+    conteos = {}
+    for fila in (
+        PedidoDetalle.objects.using(mesas.db)
+        .filter(pedido__mesa_id__in=[fila['id'] for fila in filas],
+                estado__in=('recibido', 'preparacion', 'listo'))
+        .exclude(pedido__estado='pagado')
+        .order_by()
+        .values('pedido__mesa_id', 'estado')
+        .annotate(total=Count('id'))
+    ):
+        conteos[(fila['pedido__mesa_id'], fila['estado'])] = fila['total']
+    return [
+        {
+            'id': fila['id'],
+            'numero': fila['numero'],
+            'estado': fila['estado'],
+            'pendientes': conteos.get((fila['id'], 'recibido'), 0) + conteos.get((fila['id'], 'preparacion'), 0),
+            'listos': conteos.get((fila['id'], 'listo'), 0),
+        }
+        for fila in filas
+    ]
+
+
+class AgrupadorSalon:
+    """
+    Publica en el canal 'salon-{sucursal}' el estado de las mesas que cambiaron,
+    una vez por ventana (VENTANA_SEGUNDOS) y con el estado leído al publicar:
+    si una mesa cambió varias veces, solo sale la última versión.
+    """
+    def __init__(self, sucursal_id, base_datos=None):
+        self.sucursal_id = sucursal_id
+        self.base_datos = base_datos or 'default'
+        self._lock = threading.Lock()
+        self._pendientes = set()
+        self._timer = None
+
+    def mesa_cambiada(self, mesa_id):
+        """ Marca la mesa para el próximo evento (llamar en on_commit). """
+        with self._lock:
+            self._pendientes.add(mesa_id)
+            if self._timer is None:
+                self._timer = threading.Timer(VENTANA_SEGUNDOS, self.publicar)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def publicar(self):
+        with self._lock:
+            mesa_ids, self._pendientes = self._pendientes, set()
+            self._timer = None
+        if not mesa_ids:
+            return
+        try:
+            mesas = Mesa.objects.using(self.base_datos).filter(id__in=mesa_ids).order_by('numero')
+            send_event(canal('salon', self.sucursal_id), 'mesas', {'mesas': estado_mesas(mesas)})
+        except Exception as e:
+            print(f"ERROR: No se pudo publicar el estado del salón: {e}")
+        finally:
+            # El timer corre en su propio hilo: cierra las conexiones que abrió
+            connections.close_all()
+
+
+_agrupadores = {}
+_agrupadores_lock = threading.Lock()
+
+
+def salon_de(sucursal):
+    """ Agrupador de eventos del salón de la sucursal (lo crea la primera vez). """
+    with _agrupadores_lock:
+        if sucursal.pk not in _agrupadores:
+            _agrupadores[sucursal.pk] = AgrupadorSalon(sucursal.pk, sucursal.base_datos)
+        return _agrupadores[sucursal.pk]
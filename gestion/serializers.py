@@ -1,25 +1,35 @@
-from rest_framework import serializers
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
 # Asegúrate de importar TokenObtainPairSerializer aquí
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.models import User # Necesario para UserSerializer y MyToken...
-from django.db import transaction
+from django.db import router, transaction
+from django.db.models import F
 # Importa TODOS tus modelos
-from .models import Mesa, Categoria, Producto, Pedido, PedidoDetalle
+from .models import Sucursal, Mesa, Categoria, Producto, Pedido, PedidoDetalle
+from .planificador import planificador_de
+from .salon import salon_de
+from .sucursales import sucursales_de, canal
 # Importa la función para enviar eventos SSE
 from django_eventstream import send_event
 
 # --- SERIALIZER PARA DATOS DEL USUARIO (para /api/users/me/) ---
 class UserSerializer(serializers.ModelSerializer):
     groups = serializers.SerializerMethodField()
+    sucursales = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'groups', 'is_superuser']
+        fields = ['id', 'username', 'email', 'first_name', 'last_name', 'groups', 'is_superuser', 'sucursales']
         read_only_fields = fields
 
     def get_groups(self, obj):
         return list(obj.groups.values_list('name', flat=True))
 
+    def get_sucursales(self, obj):
+        # Sucursales que el usuario puede indicar en la cabecera X-Sucursal
+        return list(sucursales_de(obj).values('id', 'nombre'))
+
 # --- SERIALIZER PARA EL MENÚ (PRODUCTOS Y CATEGORÍAS) ---
 class ProductoSerializer(serializers.ModelSerializer):
     categoria = serializers.StringRelatedField()
@@ -27,7 +37,7 @@ class ProductoSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Producto
-        fields = ['id', 'nombre', 'descripcion', 'precio', 'categoria', 'disponible', 'estacion']
+        fields = ['id', 'nombre', 'descripcion', 'precio', 'categoria', 'disponible', 'estacion', 'tiempo_preparacion', 'stock']
 
 class CategoriaSerializer(serializers.ModelSerializer):
     productos = ProductoSerializer(many=True, read_only=True)
@@ -42,7 +52,8 @@ class PedidoDetalleReadSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PedidoDetalle
-        fields = ['id', 'producto', 'cantidad', 'nota', 'precio_unitario', 'estado']
+        # producto_nombre/estacion: tal como eran al hacer el pedido
+        fields = ['id', 'producto', 'producto_nombre', 'estacion', 'cantidad', 'nota', 'precio_unitario', 'estado']
 
 class PedidoReadSerializer(serializers.ModelSerializer):
     detalles = PedidoDetalleReadSerializer(many=True, read_only=True)
@@ -52,6 +63,16 @@ class PedidoReadSerializer(serializers.ModelSerializer):
         model = Pedido
         fields = ['id', 'mesa', 'fecha_hora', 'estado', 'detalles']
 
+# Pantalla de cocina: el ítem ya trae nombre y estación copiados, así que el producto
+# va solo como id (sin Producto ni Categoria en la consulta)
+class PedidoDetalleCocinaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PedidoDetalle
+        fields = ['id', 'producto', 'producto_nombre', 'estacion', 'cantidad', 'nota', 'precio_unitario', 'estado']
+
+class PedidoCocinaSerializer(PedidoReadSerializer):
+    detalles = PedidoDetalleCocinaSerializer(many=True, read_only=True)
+
 # --- SERIALIZER PARA LEER MESAS (INCLUYENDO SUS PEDIDOS) ---
 class MesaWithPedidosSerializer(serializers.ModelSerializer):
     pedidos = PedidoReadSerializer(many=True, read_only=True)
@@ -60,14 +81,34 @@ class MesaWithPedidosSerializer(serializers.ModelSerializer):
         model = Mesa
         fields = ['id', 'numero', 'estado', 'pedidos']
 
+    def validate_numero(self, numero):
+        # El número es único dentro de la sucursal (la vista asigna la sucursal al guardar)
+        sucursal = self.context.get('sucursal')
+        if sucursal is not None:
+            repetidas = Mesa.objects.filter(sucursal=sucursal, numero=numero)
+            if self.instance is not None:
+                repetidas = repetidas.exclude(pk=self.instance.pk)
+            if repetidas.exists():
+                raise serializers.ValidationError(f"Ya existe la mesa {numero} en esta sucursal.")
+        return numero
+
 # --- SERIALIZERS PARA ESCRIBIR/CREAR PEDIDOS ---
 class PedidoDetalleWriteSerializer(serializers.ModelSerializer):
-    producto = serializers.PrimaryKeyRelatedField(queryset=Producto.objects.all())
+    # select_related: create() necesita la estación (y la sucursal) sin una consulta extra por ítem
+    producto = serializers.PrimaryKeyRelatedField(queryset=Producto.objects.select_related('categoria'))
 
     class Meta:
         model = PedidoDetalle
         fields = ['producto', 'cantidad', 'nota']
 
+    def validate_producto(self, producto):
+        sucursal = self.context.get('sucursal')
+        if sucursal is not None and producto.categoria.sucursal_id != sucursal.pk:
+            raise serializers.ValidationError(f"'{producto.nombre}' no pertenece a esta sucursal.")
+        if not producto.disponible:
+            raise serializers.ValidationError(f"'{producto.nombre}' no está disponible.")
+        return producto
+
 class PedidoCreateSerializer(serializers.ModelSerializer):
     detalles = PedidoDetalleWriteSerializer(many=True)
     mesa = serializers.PrimaryKeyRelatedField(queryset=Mesa.objects.all())
@@ -76,58 +117,141 @@ class PedidoCreateSerializer(serializers.ModelSerializer):
         model = Pedido
         fields = ['mesa', 'detalles']
 
+    def validate_mesa(self, mesa):
+        sucursal = self.context.get('sucursal')
+        if sucursal is not None and mesa.sucursal_id != sucursal.pk:
+            raise serializers.ValidationError('La mesa no pertenece a esta sucursal.')
+        return mesa
+
+    def descontar_stock(self, detalles_data):
+        """
+        Descuenta el stock de los productos del pedido (una UPDATE por producto, con F()).
+        Cada UPDATE solo aplica si alcanza el stock, así dos pedidos simultáneos no pueden
+        vender la misma unidad. Si alguno no alcanza, ValidationError (el atomic revierte todo).
+        Devuelve el nuevo stock/disponibilidad de los productos afectados.
+        """
+        cantidades = {}
+        for detalle_data in detalles_data:
+            producto = detalle_data['producto']
+            if producto.stock is not None:
+                cantidades[producto.pk] = cantidades.get(producto.pk, 0) + detalle_data['cantidad']
+        if not cantidades:
+            return []
+
+        # Orden fijo por pk para no provocar deadlocks entre pedidos concurrentes
+        for producto_id in sorted(cantidades):
+            actualizados = Producto.objects.filter(
+                pk=producto_id, stock__gte=cantidades[producto_id]
+            ).update(stock=F('stock') - cantidades[producto_id])
+            if not actualizados:
+                nombre = next(d['producto'].nombre for d in detalles_data if d['producto'].pk == producto_id)
+                raise serializers.ValidationError({'detalles': f"Stock insuficiente para '{nombre}'."})
+
+        Producto.objects.filter(pk__in=cantidades, stock=0).update(disponible=False)
+        return list(Producto.objects.filter(pk__in=cantidades).values('id', 'stock', 'disponible'))
+
     def create(self, validated_data):
-        with transaction.atomic():
+        # Base de datos de la sucursal (ver gestion/routers.py): transacción y on_commit van ahí
+        db = router.db_for_write(Pedido)
+        with transaction.atomic(using=db):
             detalles_data = validated_data.pop('detalles')
             mesa = validated_data.pop('mesa')
-            pedido = Pedido.objects.create(mesa=mesa)
+            sucursal = self.context.get('sucursal') or Sucursal.objects.get(pk=mesa.sucursal_id)
+            cambios_stock = self.descontar_stock(detalles_data)
+            pedido = Pedido.objects.create(mesa=mesa, sucursal=sucursal)
 
             if mesa.estado == 'disponible':
                 mesa.estado = 'ocupada'
                 mesa.save()
 
-            for detalle_data in detalles_data:
-                producto = detalle_data['producto']
-                
-                # --- ¡AQUÍ ESTÁ LA CORRECCIÓN! ---
-                # 1. Asigna el objeto creado a la variable 'detalle'
-                detalle = PedidoDetalle.objects.create(
+            # Todos los ítems en un solo INSERT, con la copia de nombre/estación del producto
+            detalles = PedidoDetalle.objects.bulk_create([
+                PedidoDetalle(
                     pedido=pedido,
-                    producto=producto,
+                    producto=detalle_data['producto'],
                     cantidad=detalle_data['cantidad'],
                     nota=detalle_data.get('nota', ''),
-                    precio_unitario=producto.precio
+                    precio_unitario=detalle_data['producto'].precio,
+                    producto_nombre=detalle_data['producto'].nombre,
+                    estacion=detalle_data['producto'].categoria.estacion,
                     # El estado por defecto ('recibido') se aplica desde el modelo
                 )
+                for detalle_data in detalles_data
+            ])
+            if any(detalle.pk is None for detalle in detalles):
+                # MySQL no devuelve los ids de un bulk_create: se leen en orden de inserción
+                ids = PedidoDetalle.objects.filter(pedido=pedido).order_by('pk').values_list('pk', flat=True)
+                for detalle, pk in zip(detalles, ids):
+                    detalle.pk = pk
+
+            eventos_cocina = [
+                {
+                    'detalle_id': detalle.id,
+                    'producto_nombre': detalle.producto_nombre,
+                    'cantidad': detalle.cantidad,
+                    'mesa_numero': mesa.numero,
+                    'pedido_id': pedido.id,
+                    'estado': detalle.estado
+                }
+                for detalle in detalles if detalle.estacion == 'cocina'
+            ]
+
+            def notificar():
+                # Encola los ítems en el planificador de cocina y marca la mesa en el salón
+                planificador_de(sucursal).registrar_pedido(pedido, detalles)
+                salon_de(sucursal).mesa_cambiada(mesa.id)
+                for datos in eventos_cocina:
+                    print(f"Enviando evento SSE: nuevo_item_cocina para detalle {datos['detalle_id']}")
+                    send_event(canal('cocina', sucursal.pk), 'nuevo_item', datos)
+                if cambios_stock:
+                    # Delta de disponibilidad para que los menús abiertos se actualicen sin recargar
+                    send_event(canal('menu', sucursal.pk), 'disponibilidad', {'productos': cambios_stock})
 
-                # 2. Ahora sí puedes usar 'detalle.id' y 'detalle.estado'
-                if producto.categoria.estacion == 'cocina':
-                    print(f"Enviando evento SSE: nuevo_item_cocina para detalle {detalle.id}")
-                    send_event(
-                        'cocina',       # Nombre del canal
-                        'nuevo_item',   # Tipo de evento
-                        {               # Datos que enviamos
-                            'detalle_id': detalle.id,
-                            'producto_nombre': producto.nombre,
-                            'cantidad': detalle.cantidad,
-                            'mesa_numero': mesa.numero,
-                            'pedido_id': pedido.id,
-                            'estado': detalle.estado # Ahora sí tiene el estado 'recibido'
-                        }
-                    )
-                # ---------------------------------
+            # on_commit: los avisos salen solo si el pedido se confirma. robust: si fallan
+            # (ej: Redis caído), el pedido ya está guardado y no debe responder 500 (ni duplicarse al reintentar)
+            transaction.on_commit(notificar, using=db, robust=True)
             return pedido
 
 # --- SERIALIZERS PARA ACTUALIZAR ESTADOS ---
-class PedidoUpdateSerializer(serializers.ModelSerializer):
+class ConflictoEstado(APIException):
+    """ El estado guardado ya no es el que el cliente esperaba (409). """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'El estado fue modificado por otro usuario. Recarga e intenta de nuevo.'
+    default_code = 'conflicto_estado'
+
+class EstadoCondicionalMixin:
+    """
+    Actualiza 'estado' con un único UPDATE ... WHERE estado=<esperado> (compare-and-set).
+    El estado esperado llega en 'expected_estado' (o desde el If-Match que lee la vista);
+    si no llega, se usa el estado leído al cargar la instancia.
+    Si ninguna fila coincide, otro usuario ganó la carrera y se responde 409.
+    """
+    def update(self, instance, validated_data):
+        esperado = validated_data.pop('expected_estado', None) or instance.estado
+        nuevo = validated_data.get('estado', instance.estado)
+
+        actualizadas = type(instance).objects.filter(
+            pk=instance.pk, estado=esperado
+        ).update(estado=nuevo)
+        if not actualizadas:
+            raise ConflictoEstado()
+
+        instance.estado = nuevo
+        return instance
+
+class PedidoUpdateSerializer(EstadoCondicionalMixin, serializers.ModelSerializer):
+    expected_estado = serializers.ChoiceField(choices=Pedido.ESTADO_CHOICES, write_only=True, required=False)
+
     class Meta:
         model = Pedido
-        fields = ['estado']
+        fields = ['estado', 'expected_estado']
+
+class PedidoDetalleUpdateSerializer(EstadoCondicionalMixin, serializers.ModelSerializer):
+    expected_estado = serializers.ChoiceField(choices=PedidoDetalle.ESTADO_CHOICES, write_only=True, required=False)
 
-class PedidoDetalleUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = PedidoDetalle
-        fields = ['estado']
+        fields = ['estado', 'expected_estado']
 
 # --- SERIALIZER PERSONALIZADO PARA LOGIN (JWT CON GRUPOS) ---
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -0,0 +1,101 @@
+from contextvars import ContextVar
+
+from django_eventstream.channelmanager import DefaultChannelManager
+from rest_framework.exceptions import PermissionDenied, ValidationError
+
+from .models import Sucursal
+
+# Alias de BD de la sucursal del request en curso (lo usa gestion.routers.SucursalRouter).
+# Lo fija resolver_sucursal() y lo limpia SucursalMiddleware al terminar cada request.
+base_datos_actual = ContextVar('base_datos_actual', default=None)
+
+
+def sucursales_de(user):
+    """
+    Sucursales en las que puede trabajar el usuario: las asignadas.
+    Los superusuarios pueden usar cualquiera, y si hay una sola sucursal todos
+    trabajan en ella (así una instalación de un solo local no necesita configurar nada).
+    Con varias sucursales, un usuario sin asignar no tiene acceso a ninguna.
+    """
+    if user is None or not user.is_authenticated:
+        return Sucursal.objects.none()
+    if user.is_superuser:
+        return Sucursal.objects.all()
+    asignadas = Sucursal.objects.filter(empleados=user)
+    if asignadas.exists():
+        return asignadas
+    todas = Sucursal.objects.all()
+    return todas if todas.count() == 1 else Sucursal.objects.none()
+
+
+def por_base_datos(sucursales):
+    """ Ids de las sucursales agrupados por el alias de BD donde viven sus datos. """
+    bases = {}
+    for sucursal in sucursales:
+        bases.setdefault(sucursal.base_datos or 'default', []).append(sucursal.pk)
+    return bases
+
+
+def resolver_sucursal(user, sucursal_id=None):
+    """
+    Sucursal indicada por id (si el usuario tiene acceso) o, sin id,
+    la única que puede usar el usuario. Fija la base de datos para el router.
+    """
+    candidatas = sucursales_de(user)
+    if sucursal_id:
+        sucursal_id = str(sucursal_id)
+        if not sucursal_id.isdigit():
+            raise ValidationError({'X-Sucursal': 'Debe ser el id numérico de la sucursal.'})
+        sucursal = candidatas.filter(pk=sucursal_id).first()
+        if sucursal is None:
+            raise PermissionDenied('No tienes acceso a esa sucursal.')
+    else:
+        opciones = list(candidatas[:2])
+        if not opciones:
+            raise PermissionDenied('No tienes sucursales asignadas.')
+        if len(opciones) != 1:
+            raise ValidationError({'X-Sucursal': 'Indica la sucursal con la cabecera X-Sucursal.'})
+        sucursal = opciones[0]
+
+    base_datos_actual.set(sucursal.base_datos or None)
+    return sucursal
+
+
+def sucursal_actual(request):
+    """
+    Sucursal del request: la indicada en la cabecera 'X-Sucursal' (id) o,
+    si el usuario solo puede usar una, esa. Se calcula una vez por request.
+    """
+    if not hasattr(request, '_sucursal'):
+        request._sucursal = resolver_sucursal(request.user, request.headers.get('X-Sucursal'))
+    return request._sucursal
+
+
+def canal(nombre, sucursal_id):
+    """
+    Nombre del canal SSE dentro de una sucursal (ej: 'cocina-3', 'mesa-7-3').
+    También los canales de mesa llevan la sucursal: con bases separadas los ids se repiten.
+    """
+    return f"{nombre}-{sucursal_id}"
+
+
+def sucursal_de_canal(nombre):
+    """ Id de la sucursal de un canal armado con canal() (el último segmento), o None. """
+    _, _, sufijo = nombre.rpartition('-')
+    return int(sufijo) if sufijo.isdigit() else None
+
+
+class CanalesSucursalManager(DefaultChannelManager):
+    """
+    Permisos de los canales SSE (EVENTSTREAM_CHANNELMANAGER_CLASS): un canal
+    de sucursal ('cocina-3', 'mesa-7-3', 'salon-3', 'menu-3') solo lo puede leer
+    un usuario con acceso a esa sucursal, igual que en la API y en cocina_ws.
+    """
+    def can_read_channel(self, user, channel):
+        sucursal_id = sucursal_de_canal(channel)
+        if user is None or sucursal_id is None:
+            return False
+        # Se consulta una vez por usuario (el stream vuelve a preguntar en cada lectura)
+        if not hasattr(user, '_sucursales_ids'):
+            user._sucursales_ids = set(sucursales_de(user).values_list('pk', flat=True))
+        return sucursal_id in user._sucursales_ids
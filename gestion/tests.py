@@ -1,3 +1,686 @@
-from django.test import TestCase
+import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import caches
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from django_eventstream import send_event
+
+from . import lecturas, throttling
+from .admin import UMBRAL_CONTEO_ESTIMADO, ConteoEstimadoPaginator
+from .cocina_ws import cocina_ws
+from .idempotencia import FALLIDO_TTL
+from .middleware import SESION_SUCURSAL_ADMIN, SucursalMiddleware
+from .models import Sucursal, Mesa, Categoria, Producto, Pedido, PedidoDetalle, Turno
+from . import planificador
+from .planificador import PlanificadorCocina
+from .renderers import ORJSONRenderer
+from .salon import AgrupadorSalon
+from .replicas import CACHE_ESCRITURAS, escribio_hace_poco
+from .serializers import CategoriaSerializer, MesaWithPedidosSerializer, PedidoCocinaSerializer, PedidoReadSerializer
+from .sucursales import CanalesSucursalManager, base_datos_actual, sucursales_de
+from .views import CustomTokenObtainPairSerializer
+
+
+class BaseAPITestCase(TestCase):
+    """ Sucursal única (la 'Principal' de la migración), menú mínimo y un superusuario logueado. """
+    def setUp(self):
+        # Cachés y cubetas en memoria sobreviven entre tests: se limpian
+        caches['idempotencia'].clear()
+        throttling._cubetas.clear()
+        throttling._rechazos.clear()
+        planificador._planificadores.clear()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.sucursal = Sucursal.objects.get(nombre='Principal')
+        self.cocina = Categoria.objects.create(sucursal=self.sucursal, nombre='Platos', estacion='cocina')
+        self.lomo = Producto.objects.create(nombre='Lomo', precio=Decimal('10.00'), categoria=self.cocina)
+        self.mesa = Mesa.objects.create(sucursal=self.sucursal, numero=1)
+
+    def crear_pedido(self, estado_detalle='recibido'):
+        pedido = Pedido.objects.create(mesa=self.mesa, sucursal=self.sucursal)
+        detalle = PedidoDetalle.objects.create(
+            pedido=pedido, producto=self.lomo, cantidad=1, precio_unitario=self.lomo.precio,
+            producto_nombre=self.lomo.nombre, estacion='cocina', estado=estado_detalle,
+        )
+        return pedido, detalle
+
+
+class EstadoCondicionalTests(BaseAPITestCase):
+    """ Cambios de estado con compare-and-set (expected_estado / If-Match). """
+    def url(self, detalle):
+        return f'/api/detalles-pedido/{detalle.id}/'
+
+    def test_expected_estado_desactualizado_responde_409(self):
+        _, detalle = self.crear_pedido(estado_detalle='preparacion')
+        response = self.client.patch(
+            self.url(detalle), {'estado': 'listo', 'expected_estado': 'recibido'}, format='json'
+        )
+        self.assertEqual(response.status_code, 409)
+        detalle.refresh_from_db()
+        self.assertEqual(detalle.estado, 'preparacion')
+
+    def test_segundo_cambio_con_el_mismo_estado_esperado_pierde(self):
+        _, detalle = self.crear_pedido()
+        cuerpo = {'estado': 'preparacion', 'expected_estado': 'recibido'}
+        self.assertEqual(self.client.patch(self.url(detalle), cuerpo, format='json').status_code, 200)
+        self.assertEqual(self.client.patch(self.url(detalle), cuerpo, format='json').status_code, 409)
+
+    def test_if_match_coincidente_actualiza_y_devuelve_etag(self):
+        _, detalle = self.crear_pedido()
+        response = self.client.patch(
+            self.url(detalle), {'estado': 'preparacion'}, format='json', HTTP_IF_MATCH='"recibido"'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"preparacion"')
+
+    def test_if_match_desactualizado_responde_409(self):
+        _, detalle = self.crear_pedido(estado_detalle='preparacion')
+        response = self.client.patch(
+            self.url(detalle), {'estado': 'listo'}, format='json', HTTP_IF_MATCH='W/"recibido"'
+        )
+        self.assertEqual(response.status_code, 409)
+
+    def test_if_match_con_estado_inexistente_responde_400(self):
+        _, detalle = self.crear_pedido()
+        response = self.client.patch(
+            self.url(detalle), {'estado': 'preparacion'}, format='json', HTTP_IF_MATCH='"bogus"'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('If-Match', response.json())
+        detalle.refresh_from_db()
+        self.assertEqual(detalle.estado, 'recibido')
+
+
+class IdempotenciaTests(BaseAPITestCase):
+    """ Idempotency-Key en la creación de pedidos. """
+    def crear(self, clave, **extra):
+        cuerpo = {'mesa': self.mesa.id, 'detalles': [{'producto': self.lomo.id, 'cantidad': 1}]}
+        cuerpo.update(extra)
+        return self.client.post('/api/pedidos/', cuerpo, format='json', HTTP_IDEMPOTENCY_KEY=clave)
+
+    def test_reintento_con_la_misma_clave_reproduce_la_respuesta(self):
+        primera = self.crear('k1')
+        segunda = self.crear('k1')
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_misma_clave_con_otro_cuerpo_responde_422(self):
+        self.crear('k1')
+        response = self.crear('k1', detalles=[{'producto': self.lomo.id, 'cantidad': 5}])
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_error_de_validacion_libera_la_clave(self):
+        self.lomo.disponible = False
+        self.lomo.save()
+        self.assertEqual(self.crear('k1').status_code, 400)
+        self.lomo.disponible = True
+        self.lomo.save()
+        response = self.crear('k1')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+    def test_error_despues_de_guardar_no_permite_duplicar(self):
+        # Falla después de confirmar el pedido (ej: al armar la respuesta)
+        self.client.raise_request_exception = False
+        with mock.patch('gestion.views.PedidoViewSet.get_success_headers', side_effect=RuntimeError):
+            self.assertEqual(self.crear('k1').status_code, 500)
+        self.assertEqual(Pedido.objects.count(), 1)
+        response = self.crear('k1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['codigo'], 'idempotencia_fallida')
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_clave_fallida_se_libera_pasado_fallido_ttl(self):
+        self.client.raise_request_exception = False
+        with mock.patch('gestion.views.PedidoViewSet.get_success_headers', side_effect=RuntimeError):
+            self.crear('k1')
+        # Pasado FALLIDO_TTL (y no el TTL de un día de la caché), la clave se puede volver a usar
+        with mock.patch('time.time', return_value=time.time() + FALLIDO_TTL + 1):
+            response = self.crear('k1')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+
+class BatchTests(BaseAPITestCase):
+    """ /api/batch/: todas las operaciones o ninguna. """
+    def test_falla_de_la_ultima_operacion_revierte_las_anteriores(self):
+        _, primero = self.crear_pedido(estado_detalle='listo')
+        _, segundo = self.crear_pedido(estado_detalle='preparacion')
+        response = self.client.post('/api/batch/', {'operaciones': [
+            {'method': 'PATCH', 'url': f'/api/detalles-pedido/{primero.id}/', 'body': {'estado': 'entregado'}},
+            {'method': 'PATCH', 'url': f'/api/detalles-pedido/{segundo.id}/',
+             'body': {'estado': 'entregado'}, 'if_match': 'listo'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['indice'], 1)
+        primero.refresh_from_db()
+        self.assertEqual(primero.estado, 'listo')
+
+    def test_eventos_se_envian_solo_si_el_batch_se_confirma(self):
+        _, detalle = self.crear_pedido(estado_detalle='listo')
+        with mock.patch('gestion.views.send_event') as send_event, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/batch/', {'operaciones': [
+                {'method': 'PATCH', 'url': f'/api/detalles-pedido/{detalle.id}/', 'body': {'estado': 'entregado'}},
+                {'method': 'PATCH', 'url': '/api/detalles-pedido/999999/', 'body': {'estado': 'entregado'}},
+            ]}, format='json')
+        send_event.assert_not_called()
+
+    def test_falla_al_enviar_eventos_no_afecta_al_pedido_guardado(self):
+        cuerpo = {'mesa': self.mesa.id, 'detalles': [{'producto': self.lomo.id, 'cantidad': 1}]}
+        with mock.patch('gestion.serializers.send_event', side_effect=ConnectionError), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/pedidos/', cuerpo, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 201)
+        reintento = self.client.post('/api/pedidos/', cuerpo, format='json', HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(reintento['Idempotent-Replayed'], 'true')
+        self.assertEqual(Pedido.objects.count(), 1)
+
+
+class PlanificadorTests(BaseAPITestCase):
+    """ Planificador de cocina en memoria: recargas fuera del on_commit y aviso entre procesos. """
+    def pedido(self, llegada, *platos):
+        """ Pedido que llegó en `llegada` con un ítem 'recibido' por cada (nombre, minutos de preparación). """
+        pedido = Pedido.objects.create(mesa=self.mesa, sucursal=self.sucursal)
+        Pedido.objects.filter(pk=pedido.pk).update(fecha_hora=llegada)  # auto_now_add no deja fijarla
+        for nombre, minutos in platos:
+            producto = Producto.objects.create(
+                nombre=nombre, precio=Decimal('5.00'), categoria=self.cocina, tiempo_preparacion=minutos,
+            )
+            PedidoDetalle.objects.create(
+                pedido=pedido, producto=producto, cantidad=1, precio_unitario=producto.precio,
+                producto_nombre=nombre, estacion='cocina',
+            )
+
+    def test_orden_de_la_cola_y_inicio_sugerido(self):
+        t0 = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        # Pedido 1: termina a t0+20 (lo marca el asado); la ensalada empieza tarde para terminar junto al asado
+        self.pedido(t0, ('Asado', 20), ('Ensalada', 5))
+        # Pedido 2, llega 5 minutos después: termina a t0+15
+        self.pedido(t0 + timedelta(minutes=5), ('Pasta', 10))
+        esperado = [
+            ('Asado', t0),
+            ('Pasta', t0 + timedelta(minutes=5)),
+            ('Ensalada', t0 + timedelta(minutes=15)),
+        ]
+
+        siguientes = planificador.planificador_de(self.sucursal).siguientes('cocina')
+        self.assertEqual([(t['producto_nombre'], t['inicio_sugerido']) for t in siguientes], esperado)
+
+        datos = self.client.get('/api/cocina/tickets/?estacion=cocina').json()
+        self.assertEqual(
+            [(t['producto_nombre'], datetime.fromisoformat(t['inicio_sugerido'])) for t in datos['siguientes']],
+            esperado,
+        )
+        self.assertEqual(datos['carga_minutos'], 35)
+
+    def test_cambios_no_recargan_desde_la_bd(self):
+        _, detalle = self.crear_pedido()
+        planificador = PlanificadorCocina(self.sucursal.pk)
+        with self.assertNumQueries(0):
+            planificador.actualizar_detalle(detalle.id, 'preparacion')
+        self.assertEqual([t['detalle_id'] for t in planificador.siguientes('cocina')], [detalle.id])
+
+    @override_settings(CACHES={**settings.CACHES, 'planificador': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'planificador-tests',
+    }})
+    def test_cambio_de_otro_proceso_dispara_una_recarga(self):
+        _, detalle = self.crear_pedido()
+        este, otro = PlanificadorCocina(self.sucursal.pk), PlanificadorCocina(self.sucursal.pk)
+        este.carga()
+        otro.carga()
+        otro.actualizar_detalle(detalle.id, 'listo')
+        with mock.patch.object(PlanificadorCocina, '_recargar_en_segundo_plano') as recargar:
+            otro.carga()
+            self.assertIsNone(otro._recarga)  # Su propio cambio no lo obliga a recargar
+            este.carga()
+            este._recarga.join()
+        recargar.assert_called_once()
+
+
+class StockTests(BaseAPITestCase):
+    """ Descuento de stock al crear pedidos. """
+    def setUp(self):
+        super().setUp()
+        self.lomo.stock = 5
+        self.lomo.save()
+        self.vino = Producto.objects.create(nombre='Vino', precio=Decimal('8.00'), categoria=self.cocina, stock=1)
+
+    def pedir(self, *items):
+        cuerpo = {'mesa': self.mesa.id, 'detalles': [{'producto': p.id, 'cantidad': c} for p, c in items]}
+        return self.client.post('/api/pedidos/', cuerpo, format='json')
+
+    def test_stock_insuficiente_responde_400_sin_descontar_nada(self):
+        # El lomo (pk menor) se descuenta primero; el faltante de vino revierte ese descuento
+        response = self.pedir((self.lomo, 2), (self.vino, 2))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('detalles', response.json())
+        self.lomo.refresh_from_db()
+        self.vino.refresh_from_db()
+        self.assertEqual((self.lomo.stock, self.vino.stock), (5, 1))
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_mismo_producto_en_varias_lineas_suma_las_cantidades(self):
+        self.assertEqual(self.pedir((self.lomo, 3), (self.lomo, 3)).status_code, 400)
+        self.lomo.refresh_from_db()
+        self.assertEqual(self.lomo.stock, 5)
+
+    def test_agotar_el_stock_marca_el_producto_no_disponible(self):
+        self.assertEqual(self.pedir((self.lomo, 1), (self.vino, 1)).status_code, 201)
+        self.vino.refresh_from_db()
+        self.assertEqual(self.vino.stock, 0)
+        self.assertFalse(self.vino.disponible)
+
+
+class CocinaLecturaTests(BaseAPITestCase):
+    """ La cocina lee los pedidos sin juntar Producto ni Categoria. """
+    def setUp(self):
+        super().setUp()
+        self.cocinero = User.objects.create_user('cocinero', password='x')
+        self.cocinero.groups.add(Group.objects.get_or_create(name='Cocina')[0])
+        self.client.force_authenticate(self.cocinero)
+
+    def test_listado_de_cocina_no_consulta_productos(self):
+        pedido, detalle = self.crear_pedido()
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get('/api/pedidos/')
+        self.assertEqual(response.status_code, 200)
+        sql = ' '.join(c['sql'] for c in consultas)
+        self.assertNotIn('gestion_producto', sql)
+        self.assertNotIn('gestion_categoria', sql)
+        item = response.json()[0]['detalles'][0]
+        self.assertEqual(item['producto'], self.lomo.id)
+        self.assertEqual((item['producto_nombre'], item['estacion']), ('Lomo', 'cocina'))
+        # Mismo formato al pedir un solo pedido
+        self.assertEqual(self.client.get(f'/api/pedidos/{pedido.id}/').json(), response.json()[0])
+
+
+class LecturasTests(BaseAPITestCase):
+    """ El camino rápido (lecturas + ORJSONRenderer) produce los mismos bytes que los serializers con DRF. """
+    def setUp(self):
+        super().setUp()
+        bar = Categoria.objects.create(sucursal=self.sucursal, nombre='Bebidas', estacion='bar')
+        # Separadores de línea/párrafo Unicode: DRF los escapa
+        vino = Producto.objects.create(
+            nombre='Vino', descripcion='Tinto\u2029de la casa', precio=Decimal('8.50'), categoria=bar, stock=3,
+        )
+        Mesa.objects.create(sucursal=self.sucursal, numero=2)
+        pedido, _ = self.crear_pedido(estado_detalle='preparacion')
+        PedidoDetalle.objects.create(
+            pedido=pedido, producto=vino, cantidad=2, precio_unitario=vino.precio, nota='sin hielo\u2028frío',
+            producto_nombre=vino.nombre, estacion='bar',
+        )
+        self.crear_pedido()
+
+    def comparar(self, serializer_class, rapido, queryset):
+        esperado = JSONRenderer().render(serializer_class(queryset.all(), many=True).data)
+        obtenido = ORJSONRenderer().render(rapido(queryset.all()))
+        self.assertEqual(obtenido, esperado)
+        return obtenido
+
+    def test_mesas(self):
+        salida = self.comparar(MesaWithPedidosSerializer, lecturas.mesas, Mesa.objects.order_by('numero'))
+        self.assertIn(b'sin hielo\\u2028fr', salida)
+
+    def test_categorias(self):
+        salida = self.comparar(CategoriaSerializer, lecturas.categorias, Categoria.objects.order_by('id'))
+        self.assertIn(b'Tinto\\u2029de', salida)
+
+    def test_pedidos(self):
+        pedidos = Pedido.objects.exclude(estado='pagado').order_by('fecha_hora')
+        self.comparar(PedidoReadSerializer, lecturas.pedidos, pedidos)
+        self.comparar(
+            PedidoCocinaSerializer, lambda qs: lecturas.pedidos(qs, cocina=True),
+            pedidos.filter(detalles__estacion='cocina').distinct(),
+        )
+
+
+class SucursalesTests(BaseAPITestCase):
+    """ Acceso por sucursal: API, canales SSE, login y admin. """
+    def setUp(self):
+        super().setUp()
+        self.norte = Sucursal.objects.create(nombre='Norte', base_datos='norte')
+        self.mesero = User.objects.create_user('mesero', password='x')
+        self.mesero.groups.add(Group.objects.get_or_create(name='Meseros')[0])
+
+    def test_sin_sucursal_asignada_no_accede_a_ninguna(self):
+        self.assertFalse(sucursales_de(self.mesero).exists())
+        self.client.force_authenticate(self.mesero)
+        self.assertEqual(self.client.get('/api/mesas/').status_code, 403)
+
+    def test_con_una_sola_sucursal_todos_trabajan_en_ella(self):
+        self.norte.delete()
+        self.assertEqual(list(sucursales_de(self.mesero)), [self.sucursal])
+
+    def test_canales_solo_de_sus_sucursales(self):
+        self.sucursal.empleados.add(self.mesero)
+        manager = CanalesSucursalManager()
+        self.assertTrue(manager.can_read_channel(self.mesero, f'cocina-{self.sucursal.pk}'))
+        self.assertTrue(manager.can_read_channel(self.mesero, f'mesa-{self.mesa.pk}-{self.sucursal.pk}'))
+        self.assertFalse(manager.can_read_channel(self.mesero, f'salon-{self.norte.pk}'))
+        self.assertFalse(manager.can_read_channel(self.mesero, 'cocina'))
+        self.assertFalse(manager.can_read_channel(None, f'cocina-{self.sucursal.pk}'))
+
+    def test_login_busca_el_turno_en_la_base_de_cada_sucursal(self):
+        self.sucursal.empleados.add(self.mesero)
+        login = {'username': 'mesero', 'password': 'x'}
+        with self.assertRaises(PermissionDenied):
+            CustomTokenObtainPairSerializer(data=login).is_valid()
+        Turno.objects.create(sucursal=self.sucursal, abierto_por=self.user)
+        with mock.patch.object(Turno.objects, 'using', wraps=Turno.objects.using) as using:
+            self.assertTrue(CustomTokenObtainPairSerializer(data=login).is_valid())
+        using.assert_called_once_with('default')
+
+    def test_admin_usa_la_base_de_la_sucursal_elegida(self):
+        self.client.force_login(self.user)
+        self.client.post('/admin/gestion/sucursal/', {
+            'action': 'administrar_sucursal', '_selected_action': [self.norte.pk],
+        })
+        self.assertEqual(self.client.session[SESION_SUCURSAL_ADMIN], self.norte.pk)
+
+        request = RequestFactory().get('/admin/gestion/pedido/')
+        request.user, request.session = self.user, {SESION_SUCURSAL_ADMIN: self.norte.pk}
+        vista = []
+        SucursalMiddleware(lambda r: vista.append(base_datos_actual.get()))(request)
+        self.assertEqual(vista, ['norte'])
+        # Fuera del admin manda X-Sucursal, no la sesión
+        request.path = '/api/pedidos/'
+        SucursalMiddleware(lambda r: vista.append(base_datos_actual.get()))(request)
+        self.assertEqual(vista, ['norte', None])
+
+
+@override_settings(REPLICAS_LECTURA={'default': 'default'})
+class EscrituraRecienteTests(BaseAPITestCase):
+    """ Read-your-writes: la marca de escritura va al caché compartido 'replicas'. """
+    def setUp(self):
+        super().setUp()
+        caches[CACHE_ESCRITURAS].clear()
+
+    def test_escritura_exitosa_marca_al_usuario_en_el_cache_compartido(self):
+        self.assertFalse(escribio_hace_poco(self.user))
+        self.client.force_login(self.user)  # El middleware ve el usuario de la sesión
+        response = self.client.patch(f'/api/mesas/{self.mesa.id}/', {'estado': 'ocupada'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(caches[CACHE_ESCRITURAS].get(f'escritura-reciente:{self.user.pk}'))
+        self.assertTrue(escribio_hace_poco(self.user))
+
+
+class ThrottlingTests(BaseAPITestCase):
+    """ Prioridades y límites por alcance (gestion/throttling.py). """
+    def sobrecarga(self):
+        return mock.patch.object(throttling, '_en_curso', throttling.UMBRAL_SOBRECARGA[throttling.NORMAL] + 1)
+
+    def test_batch_de_cocina_no_se_rechaza_por_sobrecarga(self):
+        _, detalle = self.crear_pedido(estado_detalle='listo')
+        with self.sobrecarga():
+            response = self.client.post('/api/batch/', {'operaciones': [
+                {'method': 'PATCH', 'url': f'/api/detalles-pedido/{detalle.id}/', 'body': {'estado': 'entregado'}},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_batch_con_operacion_de_baja_prioridad_si_se_rechaza(self):
+        with self.sobrecarga():
+            response = self.client.post('/api/batch/', {'operaciones': [
+                {'method': 'GET', 'url': '/api/mesas/salon/'},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 503)
+
+    @override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'menu.mesero': '2/min'},
+    })
+    def test_limite_por_rol_responde_429_y_se_cuenta_en_las_metricas(self):
+        mesero = User.objects.create_user('mesero', password='x')
+        mesero.groups.add(Group.objects.get_or_create(name='Meseros')[0])
+        cliente = APIClient()
+        cliente.force_authenticate(mesero)
+        respuestas = [cliente.get('/api/categorias/') for _ in range(3)]
+        self.assertEqual([r.status_code for r in respuestas], [200, 200, 429])
+        self.assertTrue(respuestas[2].has_header('Retry-After'))
+        # El admin usa la tasa general de 'menu', no la del mesero
+        self.assertEqual(self.client.get('/api/categorias/').status_code, 200)
+
+        rechazos = throttling.metricas()['rechazos']
+        self.assertEqual(rechazos, [{'alcance': 'menu', 'rol': 'mesero', 'motivo': 'limite', 'total': 1}])
+        response = self.client.get('/api/metricas/throttling/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rechazos'], rechazos)
+        self.assertEqual(cliente.get('/api/metricas/throttling/').status_code, 403)
+    def test_estado_del_salon_es_de_baja_prioridad(self):
+        with mock.patch.object(throttling, '_en_curso', throttling.UMBRAL_SOBRECARGA[throttling.BAJA] + 1):
+            self.assertEqual(self.client.get('/api/mesas/salon/').status_code, 503)
+            # Lo crítico (cocina) sigue pasando
+            _, detalle = self.crear_pedido()
+            response = self.client.patch(f'/api/detalles-pedido/{detalle.id}/', {'estado': 'preparacion'}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+
+class MesaTests(BaseAPITestCase):
+    """ Alta y edición de mesas dentro de la sucursal del request. """
+    def test_crear_mesa_la_asigna_a_la_sucursal(self):
+        response = self.client.post('/api/mesas/', {'numero': 7}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Mesa.objects.get(pk=response.json()['id']).sucursal, self.sucursal)
+
+    def test_numero_repetido_en_la_sucursal_responde_400(self):
+        response = self.client.post('/api/mesas/', {'numero': self.mesa.numero}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('numero', response.json())
+        self.assertEqual(Mesa.objects.filter(numero=self.mesa.numero).count(), 1)
+
+    def test_mismo_numero_en_otra_sucursal_esta_permitido(self):
+        norte = Sucursal.objects.create(nombre='Norte')
+        Mesa.objects.create(sucursal=norte, numero=7)
+        response = self.client.post('/api/mesas/', {'numero': 7}, format='json', HTTP_X_SUCURSAL=self.sucursal.pk)
+        self.assertEqual(response.status_code, 201)
+
+    def test_editar_sin_cambiar_el_numero_no_choca_consigo_misma(self):
+        response = self.client.patch(f'/api/mesas/{self.mesa.id}/', {'numero': self.mesa.numero}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class CocinaWSTests(BaseAPITestCase):
+    """
+    Protocolo del WebSocket de cocina (gestion/cocina_ws.py). También cubre lo que
+    usa de django_eventstream por dentro (Listener, ListenerManager): si una
+    actualización lo rompe, falla el test de eventos.
+    """
+    def setUp(self):
+        super().setUp()
+        # El test corre dentro de una transacción: no hay que cerrar la conexión
+        patcher = mock.patch('gestion.cocina_ws.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cocinero = User.objects.create_user('cocinero', password='x')
+        self.cocinero.groups.add(Group.objects.get_or_create(name='Cocina')[0])
+
+    def token(self, user=None, **vida):
+        token = AccessToken.for_user(user or self.cocinero)
+        if vida:
+            token.set_exp(lifetime=timedelta(**vida))
+        return str(token)
+
+    async def abrir(self, primer_mensaje):
+        ws = ApplicationCommunicator(cocina_ws, {
+            'type': 'websocket', 'path': '/ws/cocina/', 'headers': [], 'client': ('127.0.0.1', 50000),
+        })
+        await ws.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await ws.receive_output(2))['type'], 'websocket.accept')
+        await ws.send_input({'type': 'websocket.receive', 'text': primer_mensaje})
+        return ws
+
+    async def leer(self, ws, espera=2):
+        mensaje = await ws.receive_output(espera)
+        return json.loads(mensaje['text']) if mensaje['type'] == 'websocket.send' else mensaje
+
+    async def cerrar(self, ws):
+        await ws.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await ws.wait(2)
+
+    async def rechazo(self, primer_mensaje):
+        """ (error, código de cierre) de una conexión que no pasa la autenticación. """
+        ws = await self.abrir(primer_mensaje)
+        error = await self.leer(ws)
+        cierre = await self.leer(ws)
+        self.assertEqual(cierre['type'], 'websocket.close')
+        return error['error'], cierre['code']
+
+    @async_to_sync
+    async def test_primer_mensaje_que_no_es_json_cierra_con_4000(self):
+        _, codigo = await self.rechazo('hola')
+        self.assertEqual(codigo, 4000)
+
+    @async_to_sync
+    async def test_token_invalido_cierra_con_4001(self):
+        _, codigo = await self.rechazo(json.dumps({'token': 'no-es-un-jwt'}))
+        self.assertEqual(codigo, 4001)
+
+    @async_to_sync
+    async def test_usuario_que_no_es_de_cocina_cierra_con_4003(self):
+        mesero = await sync_to_async(User.objects.create_user)('mesero', password='x')
+        _, codigo = await self.rechazo(json.dumps({'token': self.token(mesero)}))
+        self.assertEqual(codigo, 4003)
+
+    @async_to_sync
+    async def test_sucursal_sin_acceso_cierra_con_4003(self):
+        norte = await sync_to_async(Sucursal.objects.create)(nombre='Norte')
+        await sync_to_async(self.sucursal.empleados.add)(self.cocinero)
+        _, codigo = await self.rechazo(json.dumps({'token': self.token(), 'sucursal': norte.pk}))
+        self.assertEqual(codigo, 4003)
+
+    @async_to_sync
+    async def test_token_vencido_cierra_la_conexion(self):
+        ws = await self.abrir(json.dumps({'token': self.token(seconds=1)}))
+        self.assertEqual((await self.leer(ws))['tipo'], 'conectado')
+        self.assertIn('venció', (await self.leer(ws, espera=3))['error'])
+        self.assertEqual((await self.leer(ws))['code'], 4001)
+
+    @async_to_sync
+    async def test_comandos_pasan_por_el_patch_con_su_409(self):
+        _, detalle = await sync_to_async(self.crear_pedido)(estado_detalle='preparacion')
+        ws = await self.abrir(json.dumps({'token': self.token()}))
+        conectado = await self.leer(ws)
+        self.assertEqual((conectado['tipo'], conectado['canal']), ('conectado', f'cocina-{self.sucursal.pk}'))
+
+        comando = {'ref': 'a1', 'detalle': detalle.id, 'estado': 'listo', 'desde': 'recibido'}
+        await ws.send_input({'type': 'websocket.receive', 'text': json.dumps(comando)})
+        respuesta = await self.leer(ws)
+        self.assertEqual((respuesta['tipo'], respuesta['ref'], respuesta['status']), ('respuesta', 'a1', 409))
+        await sync_to_async(detalle.refresh_from_db)()
+        self.assertEqual(detalle.estado, 'preparacion')
+
+        comando.update(ref='a2', desde='preparacion')
+        await ws.send_input({'type': 'websocket.receive', 'text': json.dumps(comando)})
+        respuesta = await self.leer(ws)
+        self.assertEqual((respuesta['ref'], respuesta['status'], respuesta['body']['estado']), ('a2', 200, 'listo'))
+        await self.cerrar(ws)
+
+    @async_to_sync
+    async def test_eventos_del_canal_de_cocina_llegan_al_socket(self):
+        ws = await self.abrir(json.dumps({'token': self.token()}))
+        await self.leer(ws)
+        datos = {'detalle_id': 1, 'producto_nombre': 'Lomo', 'cantidad': 2}
+        await sync_to_async(send_event)(f'cocina-{self.sucursal.pk}', 'nuevo_item', datos)
+        # Un evento de otra sucursal no llega
+        await sync_to_async(send_event)(f'cocina-{self.sucursal.pk + 1}', 'nuevo_item', {'detalle_id': 2})
+        self.assertEqual(await self.leer(ws), {'tipo': 'evento', 'evento': 'nuevo_item', 'datos': datos})
+        self.assertTrue(await ws.receive_nothing(0.2))
+        await self.cerrar(ws)
+
+
+class SalonTests(BaseAPITestCase):
+    """ Eventos del salón: una publicación por ventana con el estado final de cada mesa. """
+    def detalles(self, mesa, *estados, pedido_estado='recibido'):
+        pedido = Pedido.objects.create(mesa=mesa, sucursal=self.sucursal, estado=pedido_estado)
+        for estado in estados:
+            PedidoDetalle.objects.create(
+                pedido=pedido, producto=self.lomo, cantidad=1, precio_unitario=self.lomo.precio,
+                producto_nombre=self.lomo.nombre, estacion='cocina', estado=estado,
+            )
+
+    def test_varios_cambios_en_la_ventana_salen_en_un_solo_evento(self):
+        otra = Mesa.objects.create(sucursal=self.sucursal, numero=2, estado='ocupada')
+        self.detalles(self.mesa, 'recibido', 'preparacion', 'listo', 'entregado')
+        self.detalles(otra, 'listo', 'listo')
+        self.detalles(otra, 'recibido', pedido_estado='pagado')  # Ya cobrado: no cuenta
+
+        agrupador = AgrupadorSalon(self.sucursal.pk)
+        # El timer y el cierre de conexiones son del hilo de fondo: aquí se publica a mano
+        with mock.patch('gestion.salon.threading.Timer') as timer, \
+                mock.patch('gestion.salon.connections'), \
+                mock.patch('gestion.salon.send_event') as send_event:
+            for mesa_id in (self.mesa.id, otra.id, self.mesa.id, otra.id, self.mesa.id):
+                agrupador.mesa_cambiada(mesa_id)
+            timer.assert_called_once()
+            agrupador.publicar()
+            agrupador.publicar()  # Sin cambios pendientes no publica nada
+
+        send_event.assert_called_once_with(f'salon-{self.sucursal.pk}', 'mesas', {'mesas': [
+            {'id': self.mesa.id, 'numero': 1, 'estado': 'disponible', 'pendientes': 2, 'listos': 1},
+            {'id': otra.id, 'numero': 2, 'estado': 'ocupada', 'pendientes': 0, 'listos': 2},
+        ]})
+
+
+class AdminHistorialTests(BaseAPITestCase):
+    """ Listados del admin sobre tablas que crecen (pedidos, detalles, turnos). """
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def agregar_historial(self, cantidad):
+        for _ in range(cantidad):
+            self.crear_pedido()
+            Turno.objects.create(sucursal=self.sucursal, abierto_por=self.user)
+
+    def consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+
+    def test_consultas_no_crecen_con_las_filas(self):
+        for modelo in ('pedido', 'pedidodetalle', 'turno'):
+            with self.subTest(modelo=modelo):
+                url = f'/admin/gestion/{modelo}/'
+                self.agregar_historial(2)
+                pocas = self.consultas(url)
+                self.agregar_historial(20)
+                self.assertEqual(self.consultas(url), pocas)
+
+    def test_conteo_estimado_solo_sin_filtros_y_con_tablas_grandes(self):
+        self.crear_pedido()
+        self.crear_pedido()
+        grande = UMBRAL_CONTEO_ESTIMADO + 1
+        casos = [
+            # (queryset, estimación del motor, count esperado)
+            (Pedido.objects.all(), grande, grande),
+            (Pedido.objects.all(), None, 2),  # El motor no da estimación (ej: SQLite)
+            (Pedido.objects.all(), 500, 2),  # Tabla chica: se cuenta de verdad
+            (Pedido.objects.filter(estado='recibido'), grande, 2),  # Con filtros: COUNT(*)
+        ]
+        for queryset, estimado, esperado in casos:
+            with self.subTest(filtrado=bool(queryset.query.where), estimado=estimado), \
+                    mock.patch('gestion.admin.filas_estimadas', return_value=estimado) as filas_estimadas:
+                self.assertEqual(ConteoEstimadoPaginator(queryset, 50).count, esperado)
+                if queryset.query.where:
+                    filas_estimadas.assert_not_called()
@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+from .permissions import grupos_de
+
+# Prioridad de cada alcance (throttle_scope de la vista). Ante sobrecarga se
+# rechaza primero lo de menor prioridad; lo crítico (cocina, pedidos nuevos) nunca.
+CRITICA, NORMAL, BAJA = 0, 1, 2
+PRIORIDADES = {
+    'cocina': CRITICA,
+    'pedido-nuevo': CRITICA,
+    # El batch no se rechaza por sí mismo: cada operación pasa por el throttle de su vista
+    # (la entrega de ítems desde la mesa son PATCH de 'cocina', críticos)
+    'batch': CRITICA,
+    'salon': BAJA,
+    'reportes': BAJA,
+}
+# Requests en curso (por proceso) a partir de las cuales se rechaza cada prioridad
+UMBRAL_SOBRECARGA = {BAJA: 8, NORMAL: 16}
+ESPERA_SOBRECARGA = 2 # Segundos sugeridos en Retry-After
+
+# Si existe el caché 'throttle' (Redis/Memcached compartido entre procesos), los límites
+# también se cuentan allí; si no, cada proceso aplica los suyos con su cubeta local.
+CACHE_COMPARTIDO = 'throttle'
+MAX_CUBETAS = 10000
+
+_lock = threading.Lock()
+_cubetas = {} # (alcance, rol, ident) -> (fichas, última actualización)
+_en_curso = 0
+_rechazos = Counter() # (alcance, rol, motivo) -> cantidad
+_desde = timezone.now()
+
+
+class Sobrecarga(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'El servidor está ocupado atendiendo a la cocina. Reintenta en unos segundos.'
+    default_code = 'sobrecarga'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait # DRF lo envía como Retry-After
+
+
+def rol_de(user):
+    """ Rol para los límites: 'admin', 'cocina', 'mesero', 'usuario' o 'anonimo'. """
+    if not user or not user.is_authenticated:
+        return 'anonimo'
+    if user.is_superuser:
+        return 'admin'
+    grupos = grupos_de(user)
+    if 'Cocina' in grupos:
+        return 'cocina'
+    if 'Meseros' in grupos:
+        return 'mesero'
+    return 'usuario'
+
+
+def alcance_de(view):
+    """ Alcance de la acción: `throttle_scopes[action]` o, si no, `throttle_scope`. """
+    por_accion = getattr(view, 'throttle_scopes', {})
+    return por_accion.get(getattr(view, 'action', None), getattr(view, 'throttle_scope', None))
+
+
+def entrar():
+    global _en_curso
+    with _lock:
+        _en_curso += 1
+
+
+def salir():
+    global _en_curso
+    with _lock:
+        _en_curso -= 1
+
+
+def registrar_rechazo(alcance, rol, motivo):
+    with _lock:
+        _rechazos[(alcance or '-', rol, motivo)] += 1
+
+
+def metricas():
+    """ Estado actual y rechazos acumulados desde que arrancó el proceso. """
+    with _lock:
+        rechazos = [
+            {'alcance': alcance, 'rol': rol, 'motivo': motivo, 'total': total}
+            for (alcance, rol, motivo), total in sorted(_rechazos.items())
+        ]
+        return {'desde': _desde, 'en_curso': _en_curso, 'cubetas': len(_cubetas), 'rechazos': rechazos}
+
+
+def _parsear(tasa):
+    """ '30/min' -> (30, 60). Mismo formato que DEFAULT_THROTTLE_RATES de DRF. """
+    cantidad, periodo = tasa.split('/')
+    return int(cantidad), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[periodo[0]]
+
+
+def _tomar_ficha(clave, capacidad, duracion, ahora):
+    """ Cubeta de fichas en memoria: devuelve 0 si hay ficha, o los segundos hasta la próxima. """
+    por_segundo = capacidad / duracion
+    with _lock:
+        fichas, antes = _cubetas.get(clave, (capacidad, ahora))
+        fichas = min(capacidad, fichas + (ahora - antes) * por_segundo)
+        if fichas >= 1:
+            _cubetas[clave] = (fichas - 1, ahora)
+            return 0
+        _cubetas[clave] = (fichas, ahora)
+        if len(_cubetas) > MAX_CUBETAS:
+            _cubetas.clear() # Muchos clientes distintos: se reinicia (todas arrancan llenas)
+        return (1 - fichas) / por_segundo
+
+
+def _contar_compartido(clave, capacidad, duracion, ahora):
+    """ Ventana fija en el caché compartido (incr es atómico en Redis/Memcached). """
+    cache = caches[CACHE_COMPARTIDO]
+    ventana = int(ahora // duracion)
+    llave = 'throttle:' + ':'.join(map(str, clave)) + f':{ventana}'
+    cache.add(llave, 0, duracion)
+    try:
+        usados = cache.incr(llave)
+    except ValueError: # Expiró entre add e incr
+        return 0
+    return 0 if usados <= capacidad else (ventana + 1) * duracion - ahora
+
+
+class SobrecargaThrottle(BaseThrottle):
+    """
+    Rechaza con 503 las requests de menor prioridad cuando el proceso ya tiene
+    muchas en curso (las cuenta EnCursoMiddleware).
+    """
+    def allow_request(self, request, view):
+        alcance = alcance_de(view)
+        prioridad = PRIORIDADES.get(alcance, NORMAL)
+        umbral = UMBRAL_SOBRECARGA.get(prioridad)
+        if umbral is not None and _en_curso > umbral:
+            registrar_rechazo(alcance, rol_de(request.user), 'sobrecarga')
+            raise Sobrecarga(ESPERA_SOBRECARGA)
+        return True
+
+
+class RolThrottle(BaseThrottle):
+    """
+    Límite por usuario (o IP), alcance y rol, con tasas de DEFAULT_THROTTLE_RATES:
+    primero '<alcance>.<rol>' (ej: 'salon.mesero') y si no '<alcance>'.
+    Sin tasa configurada para el alcance, no limita.
+    """
+    def allow_request(self, request, view):
+        self.espera = None
+        alcance = alcance_de(view)
+        if alcance is None:
+            return True
+        rol = rol_de(request.user)
+        tasas = settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})
+        tasa = tasas.get(f'{alcance}.{rol}', tasas.get(alcance))
+        if tasa is None:
+            return True
+
+        capacidad, duracion = _parsear(tasa)
+        ident = request.user.pk if request.user.is_authenticated else self.get_ident(request)
+        clave = (alcance, rol, ident)
+        ahora = time.time()
+        self.espera = _tomar_ficha(clave, capacidad, duracion, ahora)
+        if not self.espera and CACHE_COMPARTIDO in settings.CACHES:
+            self.espera = _contar_compartido(clave, capacidad, duracion, ahora)
+        if self.espera:
+            registrar_rechazo(alcance, rol, 'limite')
+            return False
+        return True
+
+    def wait(self):
+        return self.espera
@@ -7,8 +7,11 @@ from .views import (
     ProductoViewSet,
     PedidoViewSet,
     PedidoDetalleViewSet,
-    CurrentUserView # <-- CORRECTO
+    CurrentUserView, # <-- CORRECTO
+    TicketsCocinaView,
+    MetricasThrottlingView
 )
+from .batch import BatchView
 
 router = DefaultRouter()
 # Registra todos los ViewSets con sus basenames
@@ -23,4 +26,10 @@ urlpatterns = [
     path('', include(router.urls)),
     # Añade la URL personalizada para obtener el usuario actual
     path('users/me/', CurrentUserView.as_view(), name='current-user'), # <-- CORRECTO
+    # Próximas comandas por estación (planificador de cocina)
+    path('cocina/tickets/', TicketsCocinaView.as_view(), name='tickets-cocina'),
+    # Varias operaciones sobre los ViewSets en una sola petición/transacción
+    path('batch/', BatchView.as_view(), name='batch'),
+    # Rechazos por límites de uso y sobrecarga (solo admin)
+    path('metricas/throttling/', MetricasThrottlingView.as_view(), name='metricas-throttling'),
 ]
\ No newline at end of file
@@ -1,11 +1,12 @@
 # gestion/views.py
 from decimal import Decimal
 from django.contrib.auth.models import User
+from django.db import router, transaction
 # Importaciones de DRF limpias y ordenadas
 from rest_framework import viewsets, permissions, mixins
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 # Importaciones de SimpleJWT (solo las necesarias para la vista personalizada)
@@ -23,17 +24,100 @@ from .serializers import (
     CategoriaSerializer,
     ProductoSerializer,
     PedidoReadSerializer,
+    PedidoCocinaSerializer,
     PedidoCreateSerializer,
     PedidoUpdateSerializer,
     PedidoDetalleUpdateSerializer,
     UserSerializer 
 )
 
-from .permissions import IsMeseroUser, IsCocinaUser
+from .permissions import IsMeseroUser, IsCocinaUser, grupos_de
+from .idempotencia import idempotente
+from .planificador import planificador_de
+from .salon import salon_de, estado_mesas
+from .sucursales import sucursal_actual, sucursales_de, por_base_datos, canal
+from .replicas import leer_de_replica, escribio_hace_poco
+from . import lecturas
+from . import throttling
+
+# --- PRECONDICIÓN DE ESTADO (If-Match / expected_estado) ---
+class PrecondicionEstadoMixin:
+    """
+    Para viewsets cuyo modelo tiene 'estado'.
+    Expone el estado como ETag y acepta 'If-Match' como precondición del update;
+    el serializer hace el UPDATE condicional y responde 409 si no coincide.
+    """
+    def get_estado_esperado(self, serializer):
+        # If-Match: "listo" (también acepta W/"listo"). '*' equivale a no enviar precondición.
+        if_match = self.request.headers.get('If-Match', '').strip()
+        if not if_match or if_match == '*':
+            return {}
+        if if_match.startswith('W/'):
+            if_match = if_match[2:]
+        # Mismo campo que 'expected_estado' del body: un estado inexistente es 400, no 409
+        try:
+            esperado = serializer.fields['expected_estado'].run_validation(if_match.strip('"'))
+        except ValidationError as e:
+            raise ValidationError({'If-Match': e.detail})
+        return {'expected_estado': esperado}
+
+    def perform_update(self, serializer):
+        # El 'expected_estado' del body tiene prioridad sobre el header
+        if 'expected_estado' in serializer.validated_data:
+            return serializer.save()
+        return serializer.save(**self.get_estado_esperado(serializer))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (self.action in ('retrieve', 'update', 'partial_update')
+                and response.status_code < 300
+                and isinstance(response.data, dict) and 'estado' in response.data):
+            response['ETag'] = f'"{response.data["estado"]}"'
+        return response
+
+# --- FILTRO POR SUCURSAL ---
+class SucursalMixin:
+    """
+    Limita el queryset a la sucursal del request (cabecera X-Sucursal, ver gestion/sucursales.py)
+    y la pasa a los serializers en el contexto.
+    """
+    campo_sucursal = 'sucursal'
+
+    def get_queryset(self):
+        return self.filtrar_sucursal(super().get_queryset())
+
+    def filtrar_sucursal(self, queryset):
+        return queryset.filter(**{self.campo_sucursal: sucursal_actual(self.request)})
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['sucursal'] = sucursal_actual(self.request)
+        return context
+
+class LecturaReplicaMixin:
+    """
+    Las acciones de `acciones_replica` leen de la réplica (settings.REPLICAS_LECTURA),
+    salvo que el usuario haya escrito hace unos segundos: así siempre ve sus propios cambios.
+    Solo para pantallas que toleran un atraso mínimo (salón, menú); la cocina lee de la principal.
+    """
+    acciones_replica = ('list',)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.acciones_replica and not escribio_hace_poco(request.user):
+            self._token_replica = leer_de_replica.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Se restaura al terminar la vista (también dentro de /api/batch/)
+        token = getattr(self, '_token_replica', None)
+        if token is not None:
+            leer_de_replica.reset(token)
+            self._token_replica = None
+        return super().finalize_response(request, response, *args, **kwargs)
 
 # --- VISTAS PRINCIPALES DE LA API (VIEWSETS) ---
 
-class MesaViewSet(viewsets.ModelViewSet):
+class MesaViewSet(SucursalMixin, LecturaReplicaMixin, viewsets.ModelViewSet):
     """
     API endpoint para ver y editar mesas (solo Meseros).
     Incluye acción para calcular el total.
@@ -41,6 +125,37 @@ class MesaViewSet(viewsets.ModelViewSet):
     queryset = Mesa.objects.all().order_by('numero') # Ordenamos por número de mesa
     serializer_class = MesaWithPedidosSerializer
     permission_classes = [IsMeseroUser] # Solo meseros pueden acceder
+    # El listado y el estado del salón son lo primero que se limita/rechaza (gestion/throttling.py)
+    throttle_scope = 'mesas'
+    throttle_scopes = {'list': 'salon', 'salon': 'salon'}
+
+    def list(self, request, *args, **kwargs):
+        # Camino rápido (gestion/lecturas.py): misma salida que MesaWithPedidosSerializer
+        return Response(lecturas.mesas(self.filter_queryset(self.get_queryset())))
+
+    @idempotente
+    def update(self, request, *args, **kwargs):
+        # Cambios de estado de la mesa (ej: 'disponible' al cobrar) aceptan Idempotency-Key
+        return super().update(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        sucursal = sucursal_actual(self.request)
+        mesa = serializer.save(sucursal=sucursal)
+        salon = salon_de(sucursal)
+        transaction.on_commit(lambda: salon.mesa_cambiada(mesa.id), using=router.db_for_write(Mesa), robust=True)
+
+    def perform_update(self, serializer):
+        mesa = serializer.save()
+        salon = salon_de(sucursal_actual(self.request))
+        transaction.on_commit(lambda: salon.mesa_cambiada(mesa.id), using=router.db_for_write(Mesa), robust=True)
+
+    @action(detail=False, methods=['get'])
+    def salon(self, request):
+        """
+        Estado compacto de todas las mesas (estado, ítems pendientes y listos), sin historial.
+        Los cambios siguientes llegan por el canal SSE 'salon-{sucursal}' con el mismo formato.
+        """
+        return Response(estado_mesas(self.filter_queryset(self.get_queryset())))
 
     @action(detail=True, methods=['get'])
     def calcular_total(self, request, pk=None):
@@ -74,37 +189,76 @@ class MesaViewSet(viewsets.ModelViewSet):
         return Response({'total': total})
 
 
-class CategoriaViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoriaViewSet(SucursalMixin, LecturaReplicaMixin, viewsets.ReadOnlyModelViewSet):
     """ API endpoint para ver categorías y sus productos. """
-    queryset = Categoria.objects.all()
+    queryset = Categoria.objects.all().order_by('id') # Orden fijo (sin él depende del índice que use el motor)
     serializer_class = CategoriaSerializer
     permission_classes = [permissions.IsAuthenticated] # Cualquier usuario logueado puede ver
+    throttle_scope = 'menu'
 
+    def list(self, request, *args, **kwargs):
+        # Camino rápido (gestion/lecturas.py): misma salida que CategoriaSerializer
+        return Response(lecturas.categorias(self.filter_queryset(self.get_queryset())))
 
-class ProductoViewSet(viewsets.ReadOnlyModelViewSet):
+
+class ProductoViewSet(SucursalMixin, LecturaReplicaMixin, viewsets.ReadOnlyModelViewSet):
     """ API endpoint para ver productos. """
     queryset = Producto.objects.all()
+    campo_sucursal = 'categoria__sucursal'
     serializer_class = ProductoSerializer
     permission_classes = [permissions.IsAuthenticated] # Cualquier usuario logueado puede ver
+    throttle_scope = 'menu'
 
 
-class PedidoViewSet(viewsets.ModelViewSet):
+class PedidoViewSet(SucursalMixin, PrecondicionEstadoMixin, viewsets.ModelViewSet):
     """
     API endpoint para gestionar Pedidos.
     Filtra por rol y usa serializers/permisos dinámicos.
     """
+    # Crear pedidos es crítico: no se rechaza por sobrecarga
+    throttle_scope = 'pedidos'
+    throttle_scopes = {'create': 'pedido-nuevo'}
+
+    def es_cocina(self):
+        return 'Cocina' in grupos_de(self.request.user)
+
     # queryset dinámico
     def get_queryset(self):
-        user = self.request.user
-        # Todos ven solo pedidos no pagados, ordenados por fecha
-        queryset = Pedido.objects.exclude(estado='pagado').order_by('fecha_hora')
+        # Todos ven solo pedidos no pagados de su sucursal, ordenados por fecha
+        queryset = self.filtrar_sucursal(Pedido.objects.exclude(estado='pagado')).order_by('fecha_hora')
         # Cocina solo ve pedidos que tengan items de su estación
-        if user.groups.filter(name='Cocina').exists():
+        if self.es_cocina():
             # Filtra por la relación inversa desde PedidoDetalle
-            return queryset.filter(detalles__producto__categoria__estacion='cocina').distinct()
+            # Usa la estación copiada en el detalle (sin join a Producto/Categoria)
+            return queryset.filter(detalles__estacion='cocina').distinct()
         # Meseros y Admins ven todos los pedidos activos
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        # Camino rápido (gestion/lecturas.py): misma salida que el serializer de lectura
+        return Response(lecturas.pedidos(self.filter_queryset(self.get_queryset()), cocina=self.es_cocina()))
+
+    # Creación y cambios de estado aceptan Idempotency-Key (reintentos de tablets)
+    @idempotente
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
+    @idempotente
+    def update(self, request, *args, **kwargs):
+        return super().update(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        pedido = super().perform_update(serializer)
+        sucursal = sucursal_actual(self.request)
+        db = router.db_for_write(Pedido)
+        if pedido.estado == 'pagado':
+            # Un pedido pagado ya no tiene nada que preparar
+            planificador = planificador_de(sucursal)
+            transaction.on_commit(lambda: planificador.quitar_pedido(pedido.id), using=db, robust=True)
+        salon = salon_de(sucursal)
+        transaction.on_commit(lambda: salon.mesa_cambiada(pedido.mesa_id), using=db, robust=True)
+        return pedido
+
     # serializer dinámico
     def get_serializer_class(self):
         if self.action == 'create':
@@ -113,6 +267,9 @@ class PedidoViewSet(viewsets.ModelViewSet):
         if self.action in ['update', 'partial_update']:
             return PedidoUpdateSerializer
         # Para ver listas o detalles, usamos el serializer de lectura
+        # (cocina: sin el producto anidado, le alcanza con producto_nombre/estacion)
+        if self.es_cocina():
+            return PedidoCocinaSerializer
         return PedidoReadSerializer
 
     # permisos dinámicos
@@ -129,56 +286,109 @@ class PedidoViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class PedidoDetalleViewSet(mixins.UpdateModelMixin, viewsets.GenericViewSet):
+class PedidoDetalleViewSet(SucursalMixin, PrecondicionEstadoMixin, mixins.UpdateModelMixin, viewsets.GenericViewSet):
     """
     API endpoint para actualizar el estado de un ÍTEM de pedido individual.
     ¡AHORA TAMBIÉN ENVÍA EVENTOS SSE!
     """
     queryset = PedidoDetalle.objects.all()
+    campo_sucursal = 'pedido__sucursal'
     serializer_class = PedidoDetalleUpdateSerializer
     permission_classes = [IsCocinaUser | IsMeseroUser]
+    throttle_scope = 'cocina' # Cambios de estado: prioridad máxima
+
+    @idempotente
+    def update(self, request, *args, **kwargs):
+        # Un reintento con la misma Idempotency-Key no repite el cambio ni los eventos SSE
+        return super().update(request, *args, **kwargs)
 
     # --- LÓGICA SSE ---
     def perform_update(self, serializer):
-        instance = serializer.save() # Guarda el cambio (ej: estado='listo')
+        # Guarda el cambio (ej: estado='listo') solo si el estado no cambió por detrás (409 si no)
+        instance = super().perform_update(serializer)
         print(f"Estado de detalle {instance.id} actualizado a: {instance.estado}")
+        sucursal = sucursal_actual(self.request)
 
+        def notificar():
+            # Corre después del commit: ningún error aquí debe convertir el cambio ya guardado en un 500
+            try:
+                planificador_de(sucursal).actualizar_detalle(instance.id, instance.estado)
+                salon_de(sucursal).mesa_cambiada(instance.pedido.mesa_id)
+                # Si el nuevo estado es 'listo' (marcado por cocina)
+                if instance.estado == 'listo':
+                    # Enviamos evento al canal de la mesa específica
+                    channel_name = canal(f"mesa-{instance.pedido.mesa_id}", sucursal.id)
+                    print(f"Enviando evento SSE a canal '{channel_name}': item_listo")
+                    send_event(
+                        channel_name, 
+                        'item_listo',
+                        { # Datos que enviamos al frontend (Mesa.jsx)
+                            'detalle_id': instance.id,
+                            'producto_nombre': instance.producto_nombre,
+                            'mesa_numero': instance.pedido.mesa.numero,
+                            'nuevo_estado': instance.estado
+                        }
+                    )
+                # Si el nuevo estado es 'entregado' (marcado por mesero)
+                elif instance.estado == 'entregado':
+                     # Avisamos al canal de 'cocina' para que pueda limpiar su vista
+                     print(f"Enviando evento SSE a canal 'cocina': item_entregado")
+                     send_event(
+                         canal('cocina', sucursal.id),
+                         'item_entregado',
+                          {'detalle_id': instance.id} # Solo necesitamos el ID
+                     )
+            except ImportError:
+                # Si django_eventstream no está instalado, solo imprime advertencia
+                print("WARN: django_eventstream no instalado, no se enviarán eventos SSE.")
+            except Exception as e:
+                # Captura cualquier otro error al enviar el evento
+                print(f"ERROR: No se pudo enviar el evento SSE: {e}")
+
+        # Los eventos salen solo si el cambio se confirma (importa dentro de /api/batch/)
+        transaction.on_commit(notificar, using=router.db_for_write(PedidoDetalle))
+
+# --- VISTA PARA /api/cocina/tickets/ ---
+class TicketsCocinaView(APIView):
+    """
+    Próximas comandas de una estación según el planificador de cocina.
+    Parámetros: ?estacion=cocina|bar (por defecto 'cocina') y ?limite=N (por defecto 10).
+    """
+    permission_classes = [IsCocinaUser | IsMeseroUser]
+    throttle_scope = 'tickets'
+
+    def get(self, request):
+        estacion = request.query_params.get('estacion', 'cocina')
+        if estacion not in dict(Categoria.STATION_CHOICES):
+            return Response({'error': f'Estación desconocida: {estacion}'}, status=400)
         try:
-            # Si el nuevo estado es 'listo' (marcado por cocina)
-            if instance.estado == 'listo':
-                # Enviamos evento al canal de la mesa específica
-                channel_name = f"mesa-{instance.pedido.mesa.id}"
-                print(f"Enviando evento SSE a canal '{channel_name}': item_listo")
-                send_event(
-                    channel_name, 
-                    'item_listo',
-                    { # Datos que enviamos al frontend (Mesa.jsx)
-                        'detalle_id': instance.id,
-                        'producto_nombre': instance.producto.nombre,
-                        'mesa_numero': instance.pedido.mesa.numero,
-                        'nuevo_estado': instance.estado
-                    }
-                )
-            # Si el nuevo estado es 'entregado' (marcado por mesero)
-            elif instance.estado == 'entregado':
-                 # Avisamos al canal de 'cocina' para que pueda limpiar su vista
-                 print(f"Enviando evento SSE a canal 'cocina': item_entregado")
-                 send_event(
-                     'cocina', 
-                     'item_entregado',
-                      {'detalle_id': instance.id} # Solo necesitamos el ID
-                 )
-        except ImportError:
-            # Si django_eventstream no está instalado, solo imprime advertencia
-            print("WARN: django_eventstream no instalado, no se enviarán eventos SSE.")
-        except Exception as e:
-            # Captura cualquier otro error al enviar el evento
-            print(f"ERROR: No se pudo enviar el evento SSE: {e}")
+            limite = max(1, min(int(request.query_params.get('limite', 10)), 100))
+        except ValueError:
+            return Response({'error': "'limite' debe ser un número."}, status=400)
+
+        planificador = planificador_de(sucursal_actual(request))
+        carga = planificador.carga()
+        return Response({
+            'estacion': estacion,
+            'carga_minutos': carga.get(estacion, 0),
+            'carga_por_estacion': carga,
+            'en_preparacion': planificador.en_preparacion(estacion),
+            'siguientes': planificador.siguientes(estacion, limite),
+        })
+
+# --- VISTA PARA /api/metricas/throttling/ ---
+class MetricasThrottlingView(APIView):
+    """ Requests en curso y rechazos por límite o sobrecarga (por alcance y rol) de este proceso. """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(throttling.metricas())
 
 # --- VISTA PARA /api/users/me/ ---
 class CurrentUserView(APIView):
     """ Devuelve datos del usuario actualmente autenticado. """
     permission_classes = [IsAuthenticated] # Requiere token válido
+    throttle_scope = 'usuario'
 
     def get(self, request):
         serializer = UserSerializer(request.user) 
@@ -192,8 +402,12 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         user = self.user # Usuario autenticado
         # Verifica turno solo si NO es Gerente o Superuser
         if not user.is_superuser and not user.groups.filter(name='Gerente').exists():
-            if not Turno.objects.filter(estado='abierto').exists():
-                raise PermissionDenied("No hay un turno abierto. El Gerente debe iniciar uno.")
+            # Cada sucursal busca sus turnos en su propia base (ver gestion/routers.py)
+            if not any(
+                Turno.objects.using(base).filter(estado='abierto', sucursal_id__in=ids).exists()
+                for base, ids in por_base_datos(sucursales_de(user)).items()
+            ):
+                raise PermissionDenied("No hay un turno abierto en tu sucursal. El Gerente debe iniciar uno.")
         return data 
 
 class CustomTokenObtainPairView(TokenObtainPairView):